@@ -1,17 +1,20 @@
 import os
+import json
+import time
 
 from flask_migrate import Migrate, MigrateCommand
 import urllib.parse as up
 from flask_script import Manager
 from flask import url_for
 
-from src import api, db, ma, create_app, configs, bp, security, admin
+from src import api, db, ma, create_app, configs, bp, security, admin, response_cache, stateless_tokens, \
+    barcode_index
 
 config = os.environ.get('PYTH_SRVR')
 
 config = configs.get(config, 'default')
 
-extensions = [api, db, ma, security, admin]
+extensions = [api, db, ma, security, stateless_tokens, admin, response_cache, barcode_index]
 bps = [bp]
 
 app = create_app(__name__, config, extensions=extensions, blueprints=bps)
@@ -46,5 +49,91 @@ def list_routes():
     for line in sorted(output):
         print(line)
 
+
+@manager.command
+def create_stock_ledger():
+    from src.products.ledger import create_stock_ledger
+    print('{} stock batches filled'.format(create_stock_ledger()))
+
+
+@manager.command
+def reconcile_stock():
+    from src.products.ledger import reconcile_stock
+    print('{} stock batches corrected'.format(reconcile_stock()))
+
+
+@manager.command
+def create_indexes():
+    from src.utils.models import create_missing_indexes
+    for name in create_missing_indexes():
+        print('created {}'.format(name))
+
+
+@manager.command
+def create_search_indexes():
+    from src.products.search import create_search_indexes
+    create_search_indexes()
+
+
+@manager.command
+def create_sync_triggers():
+    from src.products.sync import create_sync_triggers
+    create_sync_triggers()
+
+
+@manager.option('--days', type=int, default=None, help='defaults to SYNC_TOMBSTONE_DAYS')
+def prune_tombstones(days):
+    from src.products.sync import prune_tombstones
+    days = app.config['SYNC_TOMBSTONE_DAYS'] if days is None else days
+    print('{} tombstones removed'.format(prune_tombstones(days)))
+
+
+@manager.option('--interval', type=int, default=0, help='seconds between runs, keeps running when set')
+def mark_sold_stock(interval):
+    from src.products.ledger import mark_sold_stock
+    while True:
+        print('{} stock batches marked as sold'.format(mark_sold_stock()))
+        if not interval:
+            break
+        db.session.remove()
+        time.sleep(interval)
+
+
+@manager.option('--brands', type=int, default=1)
+@manager.option('--shops', type=int, default=2, help='shops per brand')
+@manager.option('--products', type=int, default=2000, help='products per shop')
+@manager.option('--days', type=int, default=365, help='days of order history')
+@manager.option('--orders', type=int, default=40, help='orders per shop and day')
+@manager.option('--customers', type=int, default=500, help='customers per brand')
+@manager.option('--seed', type=int, default=0, help='random seed, use a new one to add another dataset')
+@manager.option('--password', default='password')
+def seed(brands, shops, products, days, orders, customers, seed, password):
+    from src.benchmark import seed_dataset
+    users, counts = seed_dataset(brands, shops, products, days, orders, customers, seed, password)
+    for name, count in sorted(counts.items()):
+        print('{:20s} {}'.format(name, count))
+    print('log in as {} with password {}'.format(', '.join(users), password))
+
+
+@manager.option('--email', default='bench+0-0@example.com')
+@manager.option('--password', default='password')
+@manager.option('--requests', type=int, default=50, help='timed requests per scenario')
+@manager.option('--only', default=None, help='comma separated scenario names')
+@manager.option('--output', default=None, help='write the results as json, e.g. to compare commits')
+@manager.option('--baseline', default=None, help='json written by an earlier run to compare against')
+@manager.option('--no-cache', dest='no_cache', action='store_true', default=False)
+def benchmark(email, password, requests, only, output, baseline, no_cache):
+    from src.benchmark import Suite, format_results
+    # Budgets are reported in the query columns rather than failing the run.
+    app.config.update(QUERY_STATS_HEADERS=True, QUERY_BUDGET_STRICT=False)
+    if no_cache:
+        response_cache.backend = None
+    results = Suite(app, email, password).run(requests, only.split(',') if only else None)
+    print(format_results(results, json.load(open(baseline))['results'] if baseline else None))
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'config': config.__name__, 'requests': requests, 'results': results}, f, indent=2,
+                      sort_keys=True)
+
 if __name__ == "__main__":
     manager.run()
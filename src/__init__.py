@@ -1,10 +1,14 @@
 from .config import configs
-from .utils import api, db, ma, create_app, ReprMixin, bp, BaseMixin, admin, BaseSchema, BaseView, AssociationView
+from .utils import api, db, ma, create_app, ReprMixin, bp, BaseMixin, admin, BaseSchema, BaseView, AssociationView, \
+    jsonify, response_cache
 
 
 from .products import models
+from .products import ledger
+from .products.barcodes import barcode_index
 from .orders import models
 from .user import models
+from .user import authorization
 from .products import schemas
 from .orders import schemas
 from .user import schemas
@@ -12,4 +16,5 @@ from .products import views
 from .orders import views
 from .user import views
 from .utils.security import security
+from .user.tokens import stateless_tokens
 from .admin_panel import admin_manager
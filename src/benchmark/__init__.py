@@ -0,0 +1,2 @@
+from .seed import seed_dataset
+from .suite import Suite, format_results
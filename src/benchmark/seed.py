@@ -0,0 +1,184 @@
+import random
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from flask_security.utils import encrypt_password
+
+from src import db
+from src.user.models import RetailBrand, RetailShop, User, Role, Permission, UserRole, UserPermission, \
+    UserRetailShop, Customer
+from src.products.models import Brand, Tax, Tag, Salt, Distributor, BrandDistributor, Product, ProductTax, \
+    ProductTag, ProductSalt, DistributorBill, Stock
+from src.products.ledger import reconcile_stock
+from src.orders.models import Order, Item, ItemTax, Status
+
+BATCH_SIZE = 1000
+
+STATUSES = (('PLACED', 1), ('DELIVERED', 2), ('CANCELLED', 3))
+
+# Permissions the benchmark suite needs, on top of whatever the permission table already holds.
+PERMISSIONS = ('view_product', 'view_stock', 'view_order', 'create_order', 'create_order_item', 'view_tax',
+               'view_brand', 'view_tag', 'view_salt', 'view_customer', 'view_distributor',
+               'view_distributor_bill')
+
+UNITS = ('TAB', 'CAP', 'SYRUP', 'ML', 'GM', 'INJ', 'OTH')
+
+WORDS = ('amlo', 'azi', 'cetri', 'dolo', 'levo', 'metro', 'omez', 'pan', 'para', 'rani', 'telma', 'vita', 'zinc',
+         'calci', 'cipro', 'diclo', 'eno', 'glyco', 'ibu', 'keto', 'lira', 'mox', 'nimu', 'orni', 'pred', 'sina')
+
+
+class Seeder(object):
+    # Writes a synthetic chain of shops with core multi row inserts, ids are generated here so that rows can
+    # reference each other without reading anything back.
+
+    def __init__(self, seed=0, batch_size=BATCH_SIZE):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.models = []
+        self.rows = {}
+        self.counts = {}
+
+    def add(self, model, **values):
+        values.setdefault('id', str(uuid4()))
+        if model not in self.rows:
+            self.rows[model] = []
+            if model not in self.models:
+                self.models.append(model)
+        self.rows[model].append(values)
+        if len(self.rows[model]) >= self.batch_size:
+            self.flush(model)
+        return values['id']
+
+    def flush(self, model=None):
+        # Models are written in the order they were first added, parents always come before their children.
+        for table_model in self.models:
+            rows = self.rows.pop(table_model, None)
+            if rows:
+                db.session.execute(table_model.__table__.insert().values(rows))
+                self.counts[table_model.__name__] = self.counts.get(table_model.__name__, 0) + len(rows)
+            if table_model is model:
+                break
+
+    def name(self, words=2):
+        return ' '.join(self.random.choice(WORDS).capitalize() for _ in range(words))
+
+    def ensure(self, model, name, **values):
+        obj = model.query.filter(model.name == name).first()
+        if obj is None:
+            obj = model(name=name, **values)
+            db.session.add(obj)
+            db.session.flush()
+        return obj.id
+
+
+def seed_dataset(brands=1, shops=2, products=2000, days=365, orders=40, customers=500, seed=0,
+                 password='password'):
+    # ``products`` and ``customers`` are per shop and per brand, ``orders`` is per shop and day.
+    seeder = Seeder(seed)
+    rand = seeder.random
+    admin_id = seeder.ensure(Role, 'admin')
+    status_ids = [seeder.ensure(Status, name, code=code) for name, code in STATUSES]
+    for name in PERMISSIONS:
+        seeder.ensure(Permission, name)
+    permission_ids = [row.id for row in db.session.query(Permission.id)]
+    now = datetime.utcnow().replace(microsecond=0)
+    users = []
+    invoice_numbers = {}
+
+    for brand_index in range(brands):
+        label = 'Bench %d-%d' % (seed, brand_index)
+        brand_id = seeder.add(RetailBrand, name=label)
+        email = 'bench+%d-%d@example.com' % (seed, brand_index)
+        user_id = seeder.add(User, email=email, password=encrypt_password(password), name=label,
+                             mobile_number='9%04d%05d' % (seed, brand_index), active=True,
+                             retail_brand_id=brand_id)
+        users.append(email)
+        seeder.add(UserRole, user_id=user_id, role_id=admin_id)
+        for permission_id in permission_ids:
+            seeder.add(UserPermission, user_id=user_id, permission_id=permission_id)
+        customer_ids = [seeder.add(Customer, name=seeder.name(), mobile_number='8%09d' % rand.randrange(10 ** 9),
+                                   active=True, loyalty_points=0, retail_brand_id=brand_id)
+                        for _ in range(customers)]
+
+        for shop_index in range(shops):
+            shop_id = seeder.add(RetailShop, name='%s shop %d' % (label, shop_index), identity=str(uuid4())[:8],
+                                 retail_brand_id=brand_id, invoice_number=0)
+            seeder.add(UserRetailShop, user_id=user_id, retail_shop_id=shop_id)
+            invoice_numbers[shop_id] = seed_shop(seeder, shop_id, user_id, customer_ids, status_ids[0], products,
+                                                 days, orders, now)
+
+    seeder.flush()
+    for shop_id, invoice_number in invoice_numbers.items():
+        RetailShop.query.filter(RetailShop.id == shop_id).update({'invoice_number': invoice_number},
+                                                                   synchronize_session=False)
+    db.session.commit()
+    # Items were inserted around the ORM, so the stock ledger is rebuilt in one statement.
+    reconcile_stock()
+    return users, seeder.counts
+
+
+def seed_shop(seeder, shop_id, user_id, customer_ids, status_id, products, days, orders, now):
+    rand = seeder.random
+    taxes = [(seeder.add(Tax, name='GST %d' % value, value=value, retail_shop_id=shop_id, is_disabled=False), value)
+             for value in (5, 12, 18)]
+    tag_ids = [seeder.add(Tag, name=word, retail_shop_id=shop_id) for word in WORDS[:12]]
+    salt_ids = [seeder.add(Salt, name='%s %s' % (word, shop_id[:8]), retail_shop_id=shop_id) for word in WORDS]
+    brand_ids = [seeder.add(Brand, name=seeder.name(1) + ' Labs %d' % index, retail_shop_id=shop_id)
+                 for index in range(max(products // 40, 1))]
+    distributor_ids = [seeder.add(Distributor, name=seeder.name(1) + ' Pharma %d' % index, retail_shop_id=shop_id)
+                       for index in range(max(len(brand_ids) // 5, 1))]
+    for index, brand_id in enumerate(brand_ids):
+        seeder.add(BrandDistributor, brand_id=brand_id, distributor_id=distributor_ids[index % len(distributor_ids)])
+
+    catalog = []
+    for index in range(products):
+        tax_id, tax_value = rand.choice(taxes)
+        product_id = seeder.add(Product, name='%s %d' % (seeder.name(), index), min_stock=rand.randint(1, 20),
+                                auto_discount=0, is_disabled=False, default_quantity=1,
+                                quantity_label=rand.choice(UNITS), is_loose=False,
+                                barcode='%013d' % rand.randrange(10 ** 13), retail_shop_id=shop_id,
+                                brand_id=rand.choice(brand_ids))
+        seeder.add(ProductTax, product_id=product_id, tax_id=tax_id)
+        for tag_id in rand.sample(tag_ids, 2):
+            seeder.add(ProductTag, product_id=product_id, tag_id=tag_id)
+        seeder.add(ProductSalt, product_id=product_id, salt_id=rand.choice(salt_ids))
+        catalog.append((product_id, tax_id, tax_value, []))
+
+    # A purchase bill every week per distributor, restocking a slice of the catalog.
+    for week in range(days // 7 + 1):
+        purchase_date = (now - timedelta(days=days - week * 7)).date()
+        for distributor_id in distributor_ids:
+            bill_id = seeder.add(DistributorBill, purchase_date=purchase_date, distributor_id=distributor_id,
+                                 reference_number='B%d' % rand.randrange(10 ** 8))
+            for product_id, tax_id, tax_value, stocks in rand.sample(catalog, min(len(catalog), 20)):
+                purchase = round(rand.uniform(5, 500), 2)
+                stocks.append((seeder.add(Stock, purchase_amount=purchase, selling_amount=round(purchase * 1.2, 2),
+                                          units_purchased=rand.randint(50, 500), batch_number='%06d' % week,
+                                          expiry_date=purchase_date + timedelta(days=rand.randint(90, 720)),
+                                          is_sold=False, default_stock=False, distributor_bill_id=bill_id,
+                                          product_id=product_id), purchase * 1.2))
+
+    stocked = [entry for entry in catalog if entry[3]]
+    invoice_number = 0
+    for day in range(days):
+        for _ in range(orders if stocked else 0):
+            created_on = now - timedelta(days=days - day, seconds=rand.randrange(86400))
+            lines = []
+            for product_id, tax_id, tax_value, stocks in rand.sample(stocked, min(len(stocked), rand.randint(1, 5))):
+                stock_id, price = rand.choice(stocks)
+                lines.append((product_id, tax_id, tax_value, stock_id, round(price, 2), rand.randint(1, 3)))
+            total = round(sum(price * quantity for _, _, _, _, price, quantity in lines), 2)
+
+            invoice_number += 1
+            customer_id = rand.choice(customer_ids) if customer_ids and rand.random() < 0.4 else None
+            order_id = seeder.add(Order, created_on=created_on, updated_on=created_on, edit_stock=True,
+                                  invoice_number=invoice_number, auto_discount=0, is_void=False,
+                                  customer_id=customer_id, user_id=user_id, retail_shop_id=shop_id,
+                                  current_status_id=status_id, sub_total=total, total=total, amount_paid=total)
+            for product_id, tax_id, tax_value, stock_id, price, quantity in lines:
+                item_id = seeder.add(Item, created_on=created_on, updated_on=created_on, unit_price=price,
+                                     quantity=quantity, discount=0, product_id=product_id, order_id=order_id,
+                                     stock_id=stock_id)
+                seeder.add(ItemTax, item_id=item_id, tax_id=tax_id, tax_value=tax_value,
+                           tax_amount=round(price * quantity * tax_value / 100, 2))
+    return invoice_number
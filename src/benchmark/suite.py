@@ -0,0 +1,165 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from src import db
+from src.user.models import User
+from src.products.models import Product, Stock
+from src.orders.models import Status
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, rank):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = (len(values) - 1) * rank / 100.0
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+class Scenario(object):
+
+    def __init__(self, name, method, make_request):
+        self.name = name
+        self.method = method
+        self.make_request = make_request
+
+
+class Suite(object):
+    # Drives the endpoints in process through the test client, so numbers are comparable between commits on the
+    # same machine and database but do not include the HTTP server.
+
+    def __init__(self, app, email, password, seed=0):
+        self.app = app
+        self.email = email
+        self.password = password
+        self.random = random.Random(seed)
+        self.client = app.test_client()
+        self.headers = {}
+        self.shop_ids = []
+        self.products = []
+        self.words = []
+        self.barcodes = []
+        self.status_id = None
+
+    def login(self):
+        credentials = json.dumps({'email': self.email, 'password': self.password})
+        response = self.client.post('/api/v1/login/', data=credentials, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError('Could not log in as %s: %s' % (self.email, response.data[:200]))
+        self.headers = {'Authorization': json.loads(response.data.decode('utf-8'))['authentication_token'],
+                        'Content-Type': 'application/json'}
+        # Only the token authenticates the runs, as for the apps.
+        self.client.cookie_jar.clear()
+
+        with self.app.app_context():
+            user = User.query.filter(User.email == self.email).first()
+            self.shop_ids = sorted(str(shop_id) for shop_id in user.retail_shop_ids)
+            rows = db.session.query(Stock.product_id, Stock.id, Stock.selling_amount, Product.name,
+                                    Product.retail_shop_id, Product.barcode)\
+                .join(Product, Product.id == Stock.product_id)\
+                .filter(Product.retail_shop_id.in_(self.shop_ids)).limit(2000).all()
+            self.status_id = db.session.query(Status.id).filter(Status.name == 'PLACED').scalar()
+            db.session.remove()
+        self.products = [(str(row[0]), str(row[1]), row[2], str(row[4])) for row in rows]
+        self.words = sorted({word for row in rows for word in row[3].split() if not word.isdigit()})
+        self.barcodes = sorted({(str(row[4]), row[5]) for row in rows if row[5]})
+        if not self.shop_ids or not self.products:
+            raise RuntimeError('%s has no shops with stock, run the seed command first' % self.email)
+
+    def scenarios(self):
+        rand = self.random
+
+        # Pages are picked at random so that the runs are not all answered by the response cache.
+        def product_list():
+            return '/api/v1/product?__page=%d&__limit=50' % rand.randint(1, 5), None
+
+        def product_name_filter():
+            return '/api/v1/product?__name__contains=%s&__limit=20' % rand.choice(self.words), None
+
+        def product_search():
+            # What the POS search box sends while typing: the first letters of a word.
+            word = rand.choice(self.words)
+            return '/api/v1/product/search?retail_shop_id=%s&q=%s' % (rand.choice(self.shop_ids),
+                                                                      word[:rand.randint(2, len(word))]), None
+
+        def product_scan():
+            return '/api/v1/product/barcode/%s?retail_shop_id=%s' % tuple(reversed(rand.choice(self.barcodes))), None
+
+        def stock_list():
+            return '/api/v1/stock?__page=%d&__limit=50' % rand.randint(1, 5), None
+
+        def order_list():
+            return '/api/v1/order?__page=%d&__limit=20' % rand.randint(1, 5), None
+
+        def order_create():
+            shop_id = rand.choice(self.shop_ids)
+            lines = [line for line in self.products if line[3] == shop_id] or self.products
+            items = [{'product_id': product_id, 'stock_id': stock_id, 'unit_price': price, 'quantity': 1,
+                      'discount': 0} for product_id, stock_id, price, _ in rand.sample(lines, min(len(lines), 3))]
+            total = sum(item['unit_price'] for item in items)
+            return '/api/v1/order', {'retail_shop_id': shop_id, 'current_status_id': self.status_id, 'items': items,
+                                     'sub_total': total, 'total': total, 'amount_paid': total}
+
+        def order_stats():
+            to_date = datetime.utcnow()
+            from_date = to_date - timedelta(days=rand.choice((7, 30, 90, 365)))
+            return '/api/v1/order_stats/?__retail_shop_id__in=%s&__from=%s&__to=%s' % (
+                ','.join(self.shop_ids), from_date.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                to_date.strftime('%Y-%m-%dT%H:%M:%S.000Z')), None
+
+        return [Scenario('product_list', 'GET', product_list),
+                Scenario('product_name_filter', 'GET', product_name_filter),
+                Scenario('product_search', 'GET', product_search), Scenario('product_scan', 'GET', product_scan),
+                Scenario('stock_list', 'GET', stock_list), Scenario('order_list', 'GET', order_list),
+                Scenario('order_create', 'POST', order_create), Scenario('order_stats', 'GET', order_stats)]
+
+    def run_scenario(self, scenario, requests, warmup=2):
+        durations, queries, statuses = [], [], {}
+        for index in range(warmup + requests):
+            url, body = scenario.make_request()
+            started = time.perf_counter()
+            if scenario.method == 'GET':
+                response = self.client.get(url, headers=self.headers)
+            else:
+                response = self.client.open(url, method=scenario.method, data=json.dumps(body),
+                                            headers=self.headers)
+            duration = time.perf_counter() - started
+            if index < warmup:
+                continue
+            durations.append(duration * 1000)
+            queries.append(int(response.headers.get('X-Query-Count', 0)))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        result = {'requests': requests, 'statuses': {str(code): count for code, count in sorted(statuses.items())},
+                  'mean_ms': sum(durations) / len(durations), 'max_ms': max(durations),
+                  'queries_mean': sum(queries) / float(len(queries)), 'queries_max': max(queries)}
+        for rank in PERCENTILES:
+            result['p%d_ms' % rank] = percentile(durations, rank)
+        return result
+
+    def run(self, requests=50, only=None):
+        self.login()
+        results = {}
+        for scenario in self.scenarios():
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = self.run_scenario(scenario, requests)
+        return results
+
+
+def format_results(results, baseline=None):
+    columns = ['p%d_ms' % rank for rank in PERCENTILES] + ['mean_ms', 'queries_mean', 'queries_max']
+    lines = ['%-16s %s  %s' % ('scenario', ' '.join('%12s' % column for column in columns), 'statuses')]
+    for name, result in sorted(results.items()):
+        lines.append('%-16s %s  %s' % (name, ' '.join('%12.1f' % result[column] for column in columns),
+                                        ','.join('%s:%d' % item for item in sorted(result['statuses'].items()))))
+        if baseline and name in baseline:
+            lines.append('%-16s %s' % ('  vs baseline', ' '.join(
+                '%+11.0f%%' % ((result[column] / baseline[name][column] - 1) * 100) if baseline[name][column]
+                else '%12s' % '-' for column in columns)))
+    return '\n'.join(lines)
@@ -28,6 +28,69 @@ class BaseConfig:
     SECURITY_TOKEN_AUTHENTICATION_HEADER = 'Authorization'
     MAX_AGE = 86400
 
+    COMPRESS_RESPONSES = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+
+    RESPONSE_CACHE_BACKEND = 'local'
+    RESPONSE_CACHE_TIMEOUT = 300
+    RESPONSE_CACHE_SIZE = 1024
+
+    AUTHORIZATION_CACHE_TIMEOUT = 30
+
+    # Revocations reach the other workers through the shared response cache, without redis they would go on
+    # accepting a revoked token for AUTH_TOKEN_VERSION_TIMEOUT seconds.
+    STATELESS_AUTH_TOKENS = False
+    AUTH_TOKEN_VERSION_TIMEOUT = 60
+
+    METRICS_ENABLED = True
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    # /metrics answers requests with ``Authorization: Bearer <METRICS_TOKEN>`` or from METRICS_ALLOWED_IPS, and
+    # is a 404 for everyone else. Behind a proxy every request comes from the proxy's address, use the token there.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = ()
+
+    PROFILE_SORT = 'cumulative'
+    PROFILE_LIMIT = 60
+    PROFILE_SAMPLE_INTERVAL = 0.001
+
+    PRODUCT_SEARCH_LIMIT = 20
+    PRODUCT_SEARCH_MAX_LIMIT = 50
+    # Milliseconds, enforced by the database through statement_timeout.
+    PRODUCT_SEARCH_TIMEOUT = 250
+
+    BARCODE_INDEX_WARM = True
+    BARCODE_INDEX_TIMEOUT = 600
+    # Seconds between runs of the thread that loads shops and, without redis, polls for changes. 0 loads within
+    # the requests instead.
+    BARCODE_INDEX_REFRESH = 5
+
+    SYNC_PAGE_SIZE = 500
+    SYNC_MAX_PAGE_SIZE = 5000
+    # Tombstones are pruned after this many days, terminals that stayed away longer sync from scratch.
+    SYNC_TOMBSTONE_DAYS = 90
+    SYNC_SETTLE_SECONDS = 5
+    SYNC_MAX_LAG_SECONDS = 300
+
+    QUERY_STATS_HEADERS = True
+    QUERY_REPEAT_THRESHOLD = 10
+    QUERY_BUDGET_DEFAULT = None
+    QUERY_BUDGET_STRICT = False
+    # Queries a GET on the endpoint may run, strict configs fail the request when it is exceeded.
+    QUERY_BUDGETS = {
+        'product_view': 100,
+        'stock_view': 60,
+        'order_view': 30,
+        'tax_view': 10,
+        'brand_view': 10,
+        'tag_view': 10,
+        'product_search': 10,
+        'product_barcode': 10,
+        'catalog_sync': 15,
+    }
+
     @staticmethod
     def init_app(app):
         pass
@@ -38,18 +101,26 @@ class BaseConfig:
 class DevConfig(BaseConfig):
     DEBUG = True
     TESTING = True
+    METRICS_ALLOWED_IPS = ('127.0.0.1',)
     SQLALCHEMY_DATABASE_URI = 'postgresql+pygresql://postgres:@localhost/pos'
 
 
 class TestConfig(BaseConfig):
     TESTING = True
     DEBUG = True
+    QUERY_BUDGET_STRICT = True
+    BARCODE_INDEX_REFRESH = 0
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI')
 
 
 class ProdConfig(BaseConfig):
+    QUERY_STATS_HEADERS = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('PROD_DATABASE_URI') or \
                               'sqlite:///{}'.format(os.path.join(basedir, 'why-is-prod-here.db'))
+    # Every worker needs to see invalidations, so production only caches when redis is configured.
+    RESPONSE_CACHE_BACKEND = 'redis' if os.environ.get('REDIS_URL') else None
+    RESPONSE_CACHE_REDIS_URL = os.environ.get('REDIS_URL')
+    STATELESS_AUTH_TOKENS = bool(os.environ.get('REDIS_URL'))
 
 
 configs = {
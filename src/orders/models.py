@@ -49,6 +49,8 @@ class Order(BaseMixin, db.Model, ReprMixin):
     current_status = db.relationship('Status', uselist=False, foreign_keys=[current_status_id])
     time_line = db.relationship('Status', secondary='order_status')
 
+    __batch_fields__ = {'items_count': 'batch_items_count'}
+
     @hybrid_property
     def total_discount(self):
         return sum([discount.value if discount.type == 'VALUE' else float(self.total*discount/100)
@@ -62,6 +64,12 @@ class Order(BaseMixin, db.Model, ReprMixin):
     def items_count(cls):
         return select([func.Count(Item.id)]).where(Item.order_id == cls.id).as_scalar()
 
+    @classmethod
+    def batch_items_count(cls, objects):
+        counts = dict(db.session.query(Item.order_id, func.Count(Item.id))
+                      .filter(Item.order_id.in_([obj.id for obj in objects])).group_by(Item.order_id).all())
+        return {obj.id: {'items_count': counts.get(obj.id, 0)} for obj in objects}
+
     @hybrid_property
     def amount_due(self):
         if self.total and self.amount_paid:
@@ -14,6 +14,8 @@ class OrderResource(ModelResource):
 
     order_by = ('id', 'invoice_number')
 
+    fast_serializer = True
+
     filters = {
         'id': [ops.Equal],
         'customer_id': [ops.Equal],
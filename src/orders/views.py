@@ -1,9 +1,9 @@
 from datetime import datetime
 from sqlalchemy import func, and_, cast, Date, DateTime, TIMESTAMP, text, TEXT, Text
-from flask import make_response, jsonify, request
+from flask import make_response, request
 from flask_restful import Resource
 
-from src import BaseView, api
+from src import BaseView, api, jsonify
 from src.user.models import Customer
 from src.products.models import Product
 from .resources import OrderDiscountResource, ItemResource, OrderResource, ItemTaxResource, StatusResource,\
@@ -0,0 +1,285 @@
+import threading
+import time
+from collections import defaultdict
+from itertools import chain
+
+from sqlalchemy import event, inspect, func, select, and_, or_, true
+from sqlalchemy.orm import Session
+
+from src import db
+from src.utils.cache import LocalCache, response_cache, on_commit
+from src.orders.models import Item
+from .models import Product, Stock, ProductTax, Tax, Tombstone
+from .sync import settled_until
+
+INDEX_TABLES = (Product.__table__, Stock.__table__, ProductTax.__table__, Tax.__table__)
+
+GLOBAL_KEY = 'barcodes'
+
+
+def shop_key(shop_id):
+    return 'barcodes:shop:%s' % shop_id
+
+
+def product_key(product_id):
+    return 'barcodes:product:%s' % product_id
+
+
+def load_records(criterion):
+    # What the counter needs to bill a scan, for every product matching ``criterion``, in four queries however many
+    # products there are.
+    rows = db.session.query(Product.id, Product.retail_shop_id, Product.barcode, Product.name, Product.quantity_label,
+                            Product.is_loose, Product.default_quantity, Product.auto_discount, Product.is_disabled)\
+        .filter(criterion, Product.barcode.isnot(None)).all()
+    if not rows:
+        return []
+    available = dict(db.session.query(Stock.product_id, func.coalesce(func.Sum(Stock.units_purchased), 0) -
+                                      func.coalesce(func.Sum(Stock.units_sold), 0))
+                     .join(Product, Product.id == Stock.product_id)
+                     .filter(criterion, Stock.is_sold != True, Stock.expired == False).group_by(Stock.product_id).all())
+    # The batch the product endpoint takes the mrp from, so a scan bills the same price.
+    batches = {row[0]: row[1:] for row in db.session.query(Stock.product_id, Stock.id, Stock.selling_amount)
+               .join(Product, Product.id == Stock.product_id).filter(criterion, Stock.is_sold != True)
+               .distinct(Stock.product_id).order_by(Stock.product_id, Stock.id).all()}
+    taxes = defaultdict(list)
+    for product_id, tax_id, name, value in db.session.query(ProductTax.product_id, Tax.id, Tax.name, Tax.value)\
+            .join(Tax, Tax.id == ProductTax.tax_id).join(Product, Product.id == ProductTax.product_id)\
+            .filter(criterion, func.coalesce(Tax.is_disabled, False) == False).order_by(Tax.name).all():
+        taxes[product_id].append({'id': tax_id, 'name': name, 'value': value})
+
+    records = []
+    for row in rows:
+        stock_id, mrp = batches.get(row.id, (None, 0))
+        records.append({'id': row.id, 'retail_shop_id': row.retail_shop_id, 'barcode': row.barcode, 'name': row.name,
+                        'quantity_label': row.quantity_label, 'is_loose': row.is_loose,
+                        'default_quantity': row.default_quantity, 'auto_discount': row.auto_discount,
+                        'is_disabled': row.is_disabled, 'stock_id': stock_id, 'mrp': mrp,
+                        'available_stock': available.get(row.id, 0), 'taxes': taxes[row.id]})
+    return records
+
+
+class ShopIndex(object):
+
+    def __init__(self, versions, expires):
+        self.versions = versions
+        self.expires = expires
+        self.records = {}
+
+    def add(self, record, version):
+        self.records[record['barcode']] = (version, record)
+
+
+class BarcodeIndex(object):
+    # Barcode to record maps per shop, kept by every process. Records carry the version of their product, bumped
+    # after each commit that touches it, so a scan checks one counter instead of querying. With redis the counters
+    # are shared and every worker sees the commits of the others right away, otherwise a background thread polls
+    # updated_on and the tombstones every BARCODE_INDEX_REFRESH seconds. The same thread loads shops and reloads
+    # expired ones, scans never wait for a whole shop.
+
+    def __init__(self):
+        self.shops = {}
+        self.app = None
+        self.timeout = 600
+        self.interval = 5
+        self._versions = LocalCache()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._wake = threading.Event()
+        self._thread = None
+        self._polled = None
+
+    def init_app(self, app):
+        app.config.setdefault('BARCODE_INDEX_TIMEOUT', 600)
+        app.config.setdefault('BARCODE_INDEX_WARM', True)
+        app.config.setdefault('BARCODE_INDEX_REFRESH', 5)
+        self.app = app
+        self.timeout = app.config['BARCODE_INDEX_TIMEOUT']
+        self.interval = app.config['BARCODE_INDEX_REFRESH']
+        if self.interval:
+            # Started in the worker, threads do not survive gunicorn's fork.
+            app.before_first_request(self.start)
+        app.extensions['barcode_index'] = self
+
+    @property
+    def store(self):
+        return response_cache.backend if response_cache.enabled else self._versions
+
+    def bump(self, names):
+        if names:
+            self.store.bump(sorted(names))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.app.config['BARCODE_INDEX_WARM']:
+            self._pending.add(None)
+        self._thread = threading.Thread(target=self.run, name='barcode-index', daemon=True)
+        self._thread.start()
+
+    def schedule(self, shop_id):
+        with self._lock:
+            self._pending.add(shop_id)
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.refresh_shops()
+                except Exception:
+                    self.app.logger.exception('Refreshing the barcode index failed')
+                finally:
+                    db.session.remove()
+
+    def refresh_shops(self):
+        # Polled first, shops loaded afterwards are current as of the mark the next poll starts from.
+        if not response_cache.shared:
+            self.poll()
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        if None in pending:
+            pending.discard(None)
+            self.load_shops()
+        now = time.time()
+        pending.update(shop_id for shop_id, shop in list(self.shops.items()) if shop.expires < now)
+        if pending:
+            self.load_shops(sorted(pending))
+
+    def poll(self):
+        # Commits of other workers, which only bump their own counters without a shared store.
+        until = settled_until()
+        since, self._polled = self._polled, until
+        if since is None:
+            return
+
+        def window(table):
+            return and_(table.c.updated_on >= since, table.c.updated_on < until)
+
+        products, shops = set(), set()
+        for table, column in ((Product.__table__, 'id'), (Stock.__table__, 'product_id'),
+                              (ProductTax.__table__, 'product_id')):
+            products.update(row[0] for row in db.session.execute(select([table.c[column]]).where(window(table))))
+        tax = Tax.__table__
+        shops.update(row[0] for row in db.session.execute(select([tax.c.retail_shop_id]).where(window(tax))))
+        tombstone = Tombstone.__table__
+        for name, row_id, shop_id in db.session.execute(
+                select([tombstone.c.table_name, tombstone.c.row_id, tombstone.c.retail_shop_id])
+                .where(and_(window(tombstone), tombstone.c.table_name.in_([table.name for table in INDEX_TABLES])))):
+            if name == Product.__tablename__:
+                products.add(row_id)
+            elif shop_id:
+                shops.add(shop_id)
+        self.bump({product_key(product_id) for product_id in products} | {shop_key(shop_id) for shop_id in shops})
+        with self._lock:
+            self._pending.update(shop_id for shop_id in shops if shop_id in self.shops)
+
+    def load_shops(self, shop_ids=None):
+        # Versions are read after the ids and before the records, a change committed in between is picked up by
+        # the next lookup instead of being lost.
+        criterion = Product.retail_shop_id.in_(shop_ids) if shop_ids is not None else true()
+        products = db.session.query(Product.id, Product.retail_shop_id)\
+            .filter(criterion, Product.barcode.isnot(None)).all()
+        if shop_ids is None:
+            shop_ids = sorted({row[1] for row in products})
+        names = [GLOBAL_KEY] + [shop_key(shop_id) for shop_id in shop_ids] + [product_key(row[0]) for row in products]
+        versions = dict(zip(names, self.store.versions(names)))
+
+        expires = time.time() + self.timeout
+        shops = {shop_id: ShopIndex((versions[GLOBAL_KEY], versions[shop_key(shop_id)]), expires)
+                 for shop_id in shop_ids}
+        for record in load_records(criterion):
+            if product_key(record['id']) in versions:
+                shops[record['retail_shop_id']].add(record, versions[product_key(record['id'])])
+        with self._lock:
+            self.shops.update(shops)
+        return shops
+
+    def refresh(self, shop, shop_id, criterion):
+        criterion = and_(Product.retail_shop_id == shop_id, criterion)
+        ids = [row[0] for row in db.session.query(Product.id).filter(criterion, Product.barcode.isnot(None)).all()]
+        if not ids:
+            return
+        versions = dict(zip(ids, self.store.versions([product_key(product_id) for product_id in ids])))
+        for record in load_records(criterion):
+            if record['id'] in versions:
+                shop.add(record, versions[record['id']])
+
+    def find(self, shop_id, barcode):
+        records = load_records(and_(Product.retail_shop_id == shop_id, Product.barcode == barcode))
+        return records[0] if records else None
+
+    def lookup(self, shop_id, barcode):
+        shop_id = str(shop_id)
+        shop = self.shops.get(shop_id)
+        background = self._thread is not None
+        if shop is None or shop.expires < time.time():
+            if not background:
+                shop = self.load_shops([shop_id])[shop_id]
+            else:
+                # Served from the database, or from the expired entry, until the thread has (re)loaded the shop.
+                self.schedule(shop_id)
+                if shop is None:
+                    return self.find(shop_id, barcode)
+        entry = shop.records.get(barcode)
+        names = [GLOBAL_KEY, shop_key(shop_id)] + ([product_key(entry[1]['id'])] if entry else [])
+        versions = self.store.versions(names)
+        if tuple(versions[:2]) != shop.versions:
+            if background:
+                self.schedule(shop_id)
+                return self.find(shop_id, barcode)
+            shop = self.load_shops([shop_id])[shop_id]
+            entry = shop.records.get(barcode)
+            if entry is not None:
+                return entry[1]
+        elif entry is not None and versions[2] == entry[0]:
+            return entry[1]
+
+        # Unknown barcode or a changed product, the database has the answer. A product whose barcode changed
+        # leaves its old one behind.
+        criterion = Product.barcode == barcode
+        if entry is not None:
+            shop.records.pop(barcode, None)
+            criterion = or_(criterion, Product.id == entry[1]['id'])
+        self.refresh(shop, shop_id, criterion)
+        entry = shop.records.get(barcode)
+        return entry[1] if entry else None
+
+
+barcode_index = BarcodeIndex()
+
+
+def _product_ids(obj):
+    state = inspect(obj)
+    if isinstance(obj, Product):
+        return [obj.id]
+    # Moving a batch or an item to another product changes both.
+    return [product_id for product_id in state.attrs.product_id.history.sum() if product_id]
+
+
+def mark_products_changed(product_ids):
+    # For writes around the unit of work that know which products they touched.
+    db.session.info.setdefault('changed_products', set()).update(product_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_products(session, flush_context):
+    products = session.info.setdefault('changed_products', set())
+    shops = session.info.setdefault('changed_shops', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Product, Stock, ProductTax, Item)):
+            products.update(_product_ids(obj))
+        elif isinstance(obj, Tax) and obj.retail_shop_id:
+            shops.add(obj.retail_shop_id)
+
+
+@on_commit
+def _bump_versions(tables):
+    products = db.session.info.pop('changed_products', None) or ()
+    shops = db.session.info.pop('changed_shops', None) or ()
+    names = {product_key(product_id) for product_id in products} | {shop_key(shop_id) for shop_id in shops}
+    if not names and tables.intersection(INDEX_TABLES):
+        # Written around the unit of work without saying which products, e.g. bulk inserts.
+        names = {GLOBAL_KEY}
+    barcode_index.bump(names)
@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from sqlalchemy import event, inspect, func, select, cast, or_, false
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from src import db
+from src.utils import mark_changed
+from src.orders.models import Item
+from .models import Stock
+from .barcodes import mark_products_changed
+
+
+def _previous(state, key):
+    history = state.attrs[key].history
+    return history.deleted[0] if history.deleted else state.attrs[key].value
+
+
+def stock_deltas(session):
+    # Units each stock batch gains or loses with this flush, from the items being inserted, changed or deleted.
+    deltas = defaultdict(float)
+    for obj in session.new:
+        if isinstance(obj, Item) and obj.stock_id and obj.quantity:
+            deltas[obj.stock_id] += obj.quantity
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            state = inspect(obj)
+            stock_id, quantity = _previous(state, 'stock_id'), _previous(state, 'quantity')
+            if stock_id and quantity:
+                deltas[stock_id] -= quantity
+    for obj in session.dirty:
+        if isinstance(obj, Item) and obj not in session.deleted:
+            state = inspect(obj)
+            if not state.attrs.stock_id.history.has_changes() and not state.attrs.quantity.history.has_changes():
+                continue
+            old_stock_id, old_quantity = _previous(state, 'stock_id'), _previous(state, 'quantity')
+            if old_stock_id and old_quantity:
+                deltas[old_stock_id] -= old_quantity
+            if obj.stock_id and obj.quantity:
+                deltas[obj.stock_id] += obj.quantity
+    return {stock_id: delta for stock_id, delta in deltas.items() if delta}
+
+
+def is_sold(quantity_sold):
+    # Only ever sets the flag, batches staff closed by hand stay closed whatever the counter says.
+    table = Stock.__table__
+    return or_(func.coalesce(table.c.is_sold, false()), quantity_sold >= table.c.units_purchased)
+
+
+def apply_stock_deltas(session, deltas):
+    # is_sold follows the counter in the same statement, so mrp and barcode scans never pick a sold out batch.
+    table = Stock.__table__
+    for stock_id, delta in deltas.items():
+        quantity_sold = func.coalesce(table.c.quantity_sold, 0) + delta
+        session.execute(table.update().where(table.c.id == stock_id)
+                        .values(quantity_sold=quantity_sold, is_sold=is_sold(quantity_sold),
+                                updated_on=func.current_timestamp()))
+        obj = session.identity_map.get(identity_key(Stock, stock_id))
+        if obj is not None:
+            session.expire(obj, ['quantity_sold', 'is_sold', 'updated_on'])
+    session.info.setdefault('changed_tables', set()).add(table)
+
+
+@event.listens_for(Item.stock_id, 'set', active_history=True)
+@event.listens_for(Item.quantity, 'set', active_history=True)
+def _load_previous(target, value, oldvalue, initiator):
+    # Items are expired by every commit, active history loads the stored value before it is replaced so that the
+    # ledger can take it off the old batch.
+    pass
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_stock_ledger(session, flush_context):
+    # Runs inside the transaction of the flush, so the counters commit or roll back together with the items.
+    deltas = stock_deltas(session)
+    for obj in session.dirty:
+        if isinstance(obj, Stock) and inspect(obj).attrs.units_purchased.history.has_changes():
+            deltas.setdefault(obj.id, 0)
+    if deltas:
+        apply_stock_deltas(session, deltas)
+
+
+STOCK_LEDGER_DDL = (
+    'ALTER TABLE stock ADD COLUMN IF NOT EXISTS quantity_sold double precision NOT NULL DEFAULT 0',
+    'ALTER TABLE stock ALTER COLUMN quantity_sold TYPE double precision',
+)
+
+
+def create_stock_ledger():
+    # Adds the counter to databases created before it, or widens it from real, and fills it from the items.
+    for statement in STOCK_LEDGER_DDL:
+        db.session.execute(statement)
+    db.session.commit()
+    return reconcile_stock()
+
+
+def reconcile_stock():
+    # Rebuilds Stock.quantity_sold from the items, for rows written around the ORM such as seeded data.
+    table = Stock.__table__
+    sold = select([func.coalesce(func.sum(cast(Item.quantity, DOUBLE_PRECISION)), 0)])\
+        .where(Item.stock_id == table.c.id).as_scalar()
+    rows = db.session.execute(table.update().where(table.c.quantity_sold.is_distinct_from(sold))
+                              .values(quantity_sold=sold, is_sold=is_sold(sold), updated_on=func.current_timestamp())
+                              .returning(table.c.product_id)).fetchall()
+    mark_changed(Stock)
+    mark_products_changed(row[0] for row in rows)
+    db.session.commit()
+    return len(rows)
+
+
+def mark_sold_stock():
+    # Reconciliation only, the ledger keeps is_sold current. Flags sold out batches written around it, e.g.
+    # seeded data.
+    table = Stock.__table__
+    rows = db.session.execute(table.update().where(table.c.is_sold.isnot(True))
+                              .where(table.c.quantity_sold >= table.c.units_purchased)
+                              .values(is_sold=True, updated_on=func.current_timestamp())
+                              .returning(table.c.product_id)).fetchall()
+    mark_changed(Stock)
+    mark_products_changed(row[0] for row in rows)
+    db.session.commit()
+    return len(rows)
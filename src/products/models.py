@@ -1,11 +1,10 @@
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, DOUBLE_PRECISION
 from sqlalchemy import desc, UniqueConstraint
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy import and_, func, select, or_
 
 from src import db, BaseMixin, ReprMixin
-from src.orders.models import Item
 from src.user.models import RetailShop
 
 
@@ -94,6 +93,8 @@ class DistributorBill(BaseMixin, db.Model, ReprMixin):
     distributor = db.relationship('Distributor', single_parent=True, back_populates='bills')
     purchased_items = db.relationship('Stock', uselist=True, back_populates='distributor_bill', lazy='dynamic')
 
+    __batch_fields__ = {'bill_amount': 'batch_bill_totals', 'total_items': 'batch_bill_totals'}
+
     @hybrid_property
     def bill_amount(self):
         return self.purchased_items.with_entities(func.Sum(Stock.purchase_amount)).scalar()
@@ -102,6 +103,14 @@ class DistributorBill(BaseMixin, db.Model, ReprMixin):
     def total_items(self):
         return self.purchased_items.with_entities(func.Count(Stock.id)).scalar()
 
+    @classmethod
+    def batch_bill_totals(cls, objects):
+        totals = {row[0]: row[1:] for row in db.session.query(Stock.distributor_bill_id,
+                                                              func.Sum(Stock.purchase_amount), func.Count(Stock.id))
+                  .filter(Stock.distributor_bill_id.in_([obj.id for obj in objects]))
+                  .group_by(Stock.distributor_bill_id).all()}
+        return {obj.id: dict(zip(('bill_amount', 'total_items'), totals.get(obj.id, (None, 0)))) for obj in objects}
+
     @hybrid_property
     def retail_shop_id(self):
         return self.distributor.retail_shop_id
@@ -239,6 +248,15 @@ class Product(BaseMixin, db.Model, ReprMixin):
 
     UniqueConstraint('barcode', 'retail_shop_id', 'bar_retail_un')
 
+    __batch_fields__ = {'available_stock': 'batch_stock_levels', 'stock_required': 'batch_stock_levels',
+                        'is_short': 'batch_stock_levels', 'mrp': 'batch_mrp',
+                        'last_purchase_amount': 'batch_last_amounts', 'last_selling_amount': 'batch_last_amounts'}
+
+    __column_dependencies__ = {'available_stock': (), 'available_stocks': (), 'mrp': (), 'similar_products': (),
+                               'last_purchase_amount': (), 'last_selling_amount': (), 'stock_required': ('min_stock',),
+                               'is_short': ('min_stock',), 'product_name': ('name',), 'distributors': ('brand_id',),
+                               'brand_name': ('brand_id',)}
+
     @hybrid_property
     def available_stock(self):
         return self.stocks.filter(Stock.is_sold != True, Stock.expired == False)\
@@ -271,11 +289,11 @@ class Product(BaseMixin, db.Model, ReprMixin):
 
     @hybrid_property
     def last_purchase_amount(self):
-        return self.stocks.order_by(desc(Stock.purchase_date)).first().purchase_amount
+        return self.stocks.order_by(*LAST_PURCHASE_ORDER).first().purchase_amount
 
     @hybrid_property
     def last_selling_amount(self):
-        return self.stocks.order_by(desc(Stock.purchase_date)).first().selling_amount
+        return self.stocks.order_by(*LAST_PURCHASE_ORDER).first().selling_amount
 
     @hybrid_property
     def stock_required(self):
@@ -293,6 +311,34 @@ class Product(BaseMixin, db.Model, ReprMixin):
     def product_name(self):
         return self.name
 
+    @classmethod
+    def batch_stock_levels(cls, objects):
+        available = dict(db.session.query(Stock.product_id, func.coalesce(func.Sum(Stock.units_purchased), 0) -
+                                          func.coalesce(func.Sum(Stock.units_sold), 0))
+                         .filter(Stock.product_id.in_([obj.id for obj in objects]), Stock.is_sold != True,
+                                 Stock.expired == False).group_by(Stock.product_id).all())
+        values = {}
+        for obj in objects:
+            stock = available.get(obj.id, 0)
+            values[obj.id] = {'available_stock': stock, 'stock_required': abs(obj.min_stock - stock),
+                              'is_short': obj.min_stock >= stock}
+        return values
+
+    @classmethod
+    def batch_mrp(cls, objects):
+        mrp = dict(db.session.query(Stock.product_id, Stock.selling_amount)
+                   .filter(Stock.product_id.in_([obj.id for obj in objects]), Stock.is_sold != True)
+                   .distinct(Stock.product_id).order_by(Stock.product_id, Stock.id).all())
+        return {obj.id: {'mrp': mrp.get(obj.id, 0)} for obj in objects}
+
+    @classmethod
+    def batch_last_amounts(cls, objects):
+        # Products without stock are left out so that the field is skipped, like the per row hybrid does.
+        return {row[0]: {'last_purchase_amount': row[1], 'last_selling_amount': row[2]}
+                for row in db.session.query(Stock.product_id, Stock.purchase_amount, Stock.selling_amount)
+                .filter(Stock.product_id.in_([obj.id for obj in objects])).distinct(Stock.product_id)
+                .order_by(Stock.product_id, *LAST_PURCHASE_ORDER).all()}
+
     @hybrid_property
     def distributors(self):
         return self.brand.distributors.all()
@@ -345,6 +391,9 @@ class Stock(BaseMixin, db.Model, ReprMixin):
     purchase_amount = db.Column(db.Float(precision=2), nullable=False, default=0)
     selling_amount = db.Column(db.Float(precision=2), nullable=False, default=0)
     units_purchased = db.Column(db.SmallInteger, nullable=False, default=1)
+    # Sum of Item.quantity sold from the batch, kept by src.products.ledger. Double precision as it is only ever
+    # added to, real would drift.
+    quantity_sold = db.Column(DOUBLE_PRECISION, nullable=False, default=0, server_default='0')
     batch_number = db.Column(db.String(25), nullable=True)
     expiry_date = db.Column(db.Date, nullable=True)
     is_sold = db.Column(db.Boolean(), default=False, index=True)
@@ -357,22 +406,28 @@ class Stock(BaseMixin, db.Model, ReprMixin):
     product = db.relationship('Product', single_parent=True, foreign_keys=product_id)
     order_items = db.relationship('Item', uselist=True, back_populates='stock', lazy='dynamic')
 
+    __column_dependencies__ = {'units_sold': ('quantity_sold',), 'product_name': ('product_id',),
+                               'retail_shop_id': ('product_id',), 'expired': ('expiry_date',),
+                               'distributor_id': ('distributor_bill_id',), 'distributor_name': ('distributor_bill_id',),
+                               'purchase_date': ('distributor_bill_id',), 'quantity_label': ('product_id',),
+                               'brand_name': ('product_id',)}
+
     @hybrid_property
     def units_sold(self):
-
-        total_sold = self.order_items.with_entities(func.Sum(Item.quantity))\
-            .filter(Item.stock_id == self.id).scalar()
-        if total_sold:
-            if total_sold >= self.units_purchased and not self.is_sold:
-                self.is_sold = True
-                db.session.commit()
-            return total_sold
-        else:
-            return 0
+        # is_sold is kept by src.products.ledger together with quantity_sold, reads never write.
+        return self.quantity_sold or 0
 
     @units_sold.expression
     def units_sold(cls):
-        return select([func.coalesce(func.Sum(Item.quantity), 0)]).where(Item.stock_id == cls.id).as_scalar()
+        return cls.quantity_sold
+
+    @hybrid_property
+    def units_available(self):
+        return self.units_purchased - (self.quantity_sold or 0)
+
+    @units_available.expression
+    def units_available(cls):
+        return cls.units_purchased - cls.quantity_sold
 
     @hybrid_property
     def product_name(self):
@@ -444,6 +499,10 @@ class Stock(BaseMixin, db.Model, ReprMixin):
                                                      Brand.id == Product.brand_id)).as_scalar()
 
 
+# Batches bought on the same day, or without a bill, would otherwise come back in any order.
+LAST_PURCHASE_ORDER = (desc(Stock.purchase_date), desc(Stock.created_on), desc(Stock.id))
+
+
 class Combo(BaseMixin, db.Model, ReprMixin):
 
     name = db.Column(db.String(55), nullable=False, index=True)
@@ -478,3 +537,13 @@ class ProductAddOn(BaseMixin, db.Model, ReprMixin):
 
     add_on = db.relationship('AddOn', foreign_keys=[add_on_id])
     product = db.relationship('Product', foreign_keys=[product_id])
+
+
+class Tombstone(BaseMixin, db.Model, ReprMixin):
+
+    __repr_fields__ = ['table_name', 'row_id']
+
+    # Written by the delete triggers of src.products.sync, no foreign key as the shop may be going away as well.
+    table_name = db.Column(db.String(63), nullable=False)
+    row_id = db.Column(UUID, nullable=False)
+    retail_shop_id = db.Column(UUID, nullable=True, index=True)
@@ -10,6 +10,14 @@ from .schemas import ProductSchema, TaxSchema, StockSchema, BrandSchema, \
     ProductDistributorSchema, ProductSaltSchema, ProductTagSchema, BrandDistributorSchema
 
 
+def has_product_access(product_ids):
+    # Every product exists and belongs to one of the user's shops, checked with one query for the whole set.
+    product_ids = {str(product_id) for product_id in product_ids}
+    shops = dict(Product.query.with_entities(Product.id, Product.retail_shop_id)
+                 .filter(Product.id.in_(product_ids)).all()) if product_ids else {}
+    return len(shops) == len(product_ids) and set(shops.values()) <= set(current_user.retail_shop_ids)
+
+
 class ProductResource(ModelResource):
     model = Product
     schema = ProductSchema
@@ -20,6 +28,20 @@ class ProductResource(ModelResource):
 
     max_limit = 500
 
+    fast_serializer = True
+
+    bulk_insert = True
+
+    batch_update = True
+
+    etag = True
+
+    cache = True
+
+    # Hybrids read stock levels, distributors and salts outside of the dumped relationships. Sales reach the
+    # stock rows through the ledger.
+    etag_related = ('stocks', 'brand.distributors', 'salts')
+
     optional = ('distributors', 'brand', 'retail_shop', 'stocks', 'similar_products', 'available_stocks',
                 'last_purchase_amount', 'last_selling_amount', 'stock_required')
 
@@ -46,16 +68,19 @@ class ProductResource(ModelResource):
     def has_change_permission(self, obj):
         return current_user.has_shop_access(obj.retail_shop_id) and current_user.has_permission('change_product')
 
+    def has_batch_change_permission(self, objects):
+        if not current_user.has_permission('change_product'):
+            return [False] * len(objects)
+        shops = set(current_user.retail_shop_ids)
+        return [str(obj.retail_shop_id) in shops for obj in objects]
+
     def has_delete_permission(self, obj):
         return current_user.has_shop_access(obj.retail_shop_id) and current_user.has_permission('remove_product')
 
     def has_add_permission(self, objects):
         if not current_user.has_permission('create_product'):
             return False
-        for obj in objects:
-            if not current_user.has_shop_access(obj.retail_shop_id):
-                return False
-        return True
+        return {str(obj.retail_shop_id) for obj in objects} <= set(current_user.retail_shop_ids)
 
 
 class TagResource(ModelResource):
@@ -64,6 +89,8 @@ class TagResource(ModelResource):
 
     auth_required = True
 
+    etag = True
+
     optional = ('products', 'retail_shop')
 
     order_by = ['retail_shop_id', 'id', 'name']
@@ -105,6 +132,19 @@ class StockResource(ModelResource):
 
     max_export_limit = 500
 
+    export_unlimited_roles = ('admin', 'owner')
+
+    fast_serializer = True
+
+    bulk_insert = True
+
+    batch_update = True
+
+    cache = True
+
+    # product_name, brand_name and quantity_label are read through hybrids.
+    etag_related = ('product.brand',)
+
     optional = ('product', 'retail_shop', 'distributor_bill', 'product_name', 'retail_shop_id', 'distributor_name')
 
     filters = {
@@ -137,17 +177,22 @@ class StockResource(ModelResource):
     def has_change_permission(self, obj):
         return current_user.has_shop_access(obj.retail_shop_id) and current_user.has_permission('change_stock')
 
+    def has_batch_change_permission(self, objects):
+        if not current_user.has_permission('change_stock'):
+            return [False] * len(objects)
+        product_ids = {str(obj.product_id) for obj in objects}
+        shops = dict(Product.query.with_entities(Product.id, Product.retail_shop_id)
+                     .filter(Product.id.in_(product_ids)).all()) if product_ids else {}
+        allowed = set(current_user.retail_shop_ids)
+        return [shops.get(str(obj.product_id)) in allowed for obj in objects]
+
     def has_delete_permission(self, obj):
         return current_user.has_shop_access(obj.retail_shop_id) and current_user.has_permission('remove_stock')
 
     def has_add_permission(self, objects):
         if not current_user.has_permission('create_stock'):
             return False
-        for obj in objects:
-            if not current_user.has_shop_access(Product.query.with_entities(Product.retail_shop_id)
-                                                        .filter(Product.id == obj.product_id).scalar()):
-                return False
-        return True
+        return has_product_access(obj.product_id for obj in objects)
 
 
 class DistributorResource(ModelResource):
@@ -234,6 +279,10 @@ class BrandResource(ModelResource):
 
     auth_required = True
 
+    etag = True
+
+    cache = True
+
     order_by = ['retail_shop_id', 'id', 'name']
 
     optional = ('products', 'retail_shop', 'distributors')
@@ -268,6 +317,11 @@ class TaxResource(ModelResource):
     schema = TaxSchema
 
     auth_required = True
+
+    etag = True
+
+    cache = True
+
     optional = ('products', 'retail_shop')
 
     order_by = ['retail_shop_id', 'id', 'name']
@@ -439,6 +493,10 @@ class ProductTagResource(AssociationModelResource):
 
     auth_required = True
 
+    bulk_relations = True
+
+    relation_keys = ('tag_id', 'product_id')
+
     roles_accepted = ('admin',)
 
     optional = ('product', 'salt')
@@ -464,6 +522,10 @@ class ProductTagResource(AssociationModelResource):
             return False
         return True
 
+    def has_bulk_permission(self, action, rows):
+        permission = 'create_product_tag' if action == 'add' else 'remove_product_tag'
+        return current_user.has_permission(permission) and has_product_access(row['product_id'] for row in rows)
+
 
 class ProductSaltResource(AssociationModelResource):
     model = ProductSalt
@@ -472,6 +534,10 @@ class ProductSaltResource(AssociationModelResource):
 
     auth_required = True
 
+    bulk_relations = True
+
+    relation_keys = ('salt_id', 'product_id')
+
     default_limit = 100
 
     max_limit = 500
@@ -505,6 +571,10 @@ class ProductSaltResource(AssociationModelResource):
             return False
         return True
 
+    def has_bulk_permission(self, action, rows):
+        permission = 'create_product_salt' if action == 'add' else 'remove_product_salt'
+        return current_user.has_permission(permission) and has_product_access(row['product_id'] for row in rows)
+
 
 class ProductTaxResource(AssociationModelResource):
     model = ProductTax
@@ -512,6 +582,10 @@ class ProductTaxResource(AssociationModelResource):
 
     auth_required = True
 
+    bulk_relations = True
+
+    relation_keys = ('tax_id', 'product_id')
+
     def has_read_permission(self, qs):
         if current_user.has_permission('view_product_tax'):
             return qs.filter(self.model.retail_shop_id.in_(current_user.retail_shop_ids))
@@ -530,6 +604,10 @@ class ProductTaxResource(AssociationModelResource):
             return False
         return True
 
+    def has_bulk_permission(self, action, rows):
+        permission = 'create_product_tax' if action == 'add' else 'remove_product_tax'
+        return current_user.has_permission(permission) and has_product_access(row['product_id'] for row in rows)
+
 
 class BrandDistributorResource(AssociationModelResource):
     model = BrandDistributor
@@ -127,7 +127,7 @@ class ProductSchema(BaseSchema):
 class StockSchema(BaseSchema):
     class Meta:
         model = Stock
-        exclude = ('order_items', 'created_on', 'updated_on')
+        exclude = ('order_items', 'created_on', 'updated_on', 'quantity_sold')
 
     purchase_amount = ma.Float(precision=2)
     selling_amount = ma.Float(precision=2)
@@ -0,0 +1,105 @@
+import re
+
+from sqlalchemy import DDL, event, func, select, union, and_, case, literal_column, desc
+from sqlalchemy.exc import OperationalError
+
+from src import db
+from .models import Product, Brand, Salt, ProductSalt
+
+# Expression indexes, the queries below build the very same expressions so the planner can use them.
+SEARCH_INDEXES = (
+    (Product, "CREATE INDEX IF NOT EXISTS ix_product_name_search ON product "
+              "USING gin (to_tsvector('simple', name))"),
+    (Product, "CREATE INDEX IF NOT EXISTS ix_product_shop_name_prefix ON product "
+              "(retail_shop_id, lower(name) text_pattern_ops)"),
+    (Product, "CREATE INDEX IF NOT EXISTS ix_product_shop_barcode ON product (retail_shop_id, barcode)"),
+    (Brand, "CREATE INDEX IF NOT EXISTS ix_brand_name_search ON brand USING gin (to_tsvector('simple', name))"),
+    (Salt, "CREATE INDEX IF NOT EXISTS ix_salt_name_search ON salt USING gin (to_tsvector('simple', name))"),
+)
+
+for model, statement in SEARCH_INDEXES:
+    event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def create_search_indexes():
+    # For databases created before the indexes were declared, create_all() adds them to new ones.
+    for model, statement in SEARCH_INDEXES:
+        db.session.execute(statement)
+    db.session.commit()
+
+
+def document(column):
+    return func.to_tsvector(literal_column("'simple'"), column)
+
+
+def prefix_query(term):
+    # Every word of the term has to start a word of the name: "para 65" finds "Paracetamol 650".
+    words = WORD.findall(term.lower())
+    if not words:
+        return None
+    return func.to_tsquery(literal_column("'simple'"), ' & '.join('%s:*' % word for word in words))
+
+
+def like_prefix(term):
+    return term.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_products(retail_shop_id, term, limit=20, timeout=None):
+    term = ' '.join(term.split())
+    query = prefix_query(term)
+    if query is None:
+        return []
+    name_match = document(Product.name).op('@@')(query)
+    brand_match = document(Brand.name).op('@@')(query)
+    salt_match = document(Salt.name).op('@@')(query)
+
+    # Each branch can use its own index, a single OR across the joined tables could not.
+    candidates = union(
+        select([Product.id]).where(and_(Product.retail_shop_id == retail_shop_id, name_match)),
+        select([Product.id]).where(and_(Product.retail_shop_id == retail_shop_id,
+                                        func.lower(Product.name).like(like_prefix(term)))),
+        select([Product.id]).where(and_(Product.retail_shop_id == retail_shop_id, Product.barcode == term)),
+        select([Product.id]).select_from(Product.__table__.join(Brand.__table__, Brand.id == Product.brand_id))
+        .where(and_(Brand.retail_shop_id == retail_shop_id, Product.retail_shop_id == retail_shop_id, brand_match)),
+        select([ProductSalt.product_id]).select_from(ProductSalt.__table__.join(Salt.__table__,
+                                                                                Salt.id == ProductSalt.salt_id))
+        .where(and_(Salt.retail_shop_id == retail_shop_id, salt_match)),
+    ).alias('candidates')
+
+    salt_rank = select([func.max(func.ts_rank(document(Salt.name), query))])\
+        .where(and_(ProductSalt.product_id == Product.id, Salt.id == ProductSalt.salt_id)).as_scalar()
+    rank = func.greatest(func.ts_rank(document(Product.name), query, 1),
+                         func.coalesce(func.ts_rank(document(Brand.name), query), 0) * 0.8,
+                         func.coalesce(salt_rank, 0) * 0.6)
+    # Scanned barcodes first, then names starting with the term, then names with a word starting with it.
+    boost = case([(Product.barcode == term, 10),
+                  (func.lower(Product.name).like(like_prefix(term)), 2),
+                  (name_match, 1)], else_=0)
+    score = (rank + boost).label('score')
+
+    statement = select([Product.id, Product.name, Product.barcode, Product.brand_id, Brand.name.label('brand_name'),
+                        Product.quantity_label, Product.is_disabled, score])\
+        .select_from(Product.__table__.join(candidates, candidates.c.id == Product.id)
+                     .outerjoin(Brand.__table__, Brand.id == Product.brand_id))\
+        .where(Product.retail_shop_id == retail_shop_id)\
+        .order_by(desc('score'), func.length(Product.name), Product.name).limit(limit)
+
+    try:
+        if timeout:
+            # Only for this transaction, a slow search is cancelled by the server instead of piling up.
+            db.session.execute('SET LOCAL statement_timeout = %d' % int(timeout))
+        rows = db.session.execute(statement).fetchall()
+        if timeout:
+            db.session.execute('SET LOCAL statement_timeout TO DEFAULT')
+    except OperationalError as e:
+        db.session.rollback()
+        if 'statement timeout' in str(e.orig):
+            raise SearchTimeout(term)
+        raise
+    return [dict(row, score=round(row['score'], 4)) for row in rows]
@@ -0,0 +1,135 @@
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import DDL, event, select, and_, func
+
+from src import db
+from src.utils.exceptions import CustomException
+from src.utils.pagination import encode_cursor, decode_cursor, keyset_filter, DATETIME_FORMAT, DATE_FORMAT
+from .models import Brand, Tax, Tag, Product, ProductTax, ProductTag, Stock, Tombstone
+
+# In the order terminals apply them, rows come after the rows they point at.
+SYNC_MODELS = (Brand, Tax, Tag, Product, ProductTax, ProductTag, Stock)
+
+TOKEN_KEYS = ['shop', 'since', 'until', 'table', 'updated_on', 'id']
+
+# Triggers rather than flush events, so that bulk deletes and foreign key cascades leave tombstones as well.
+TOMBSTONE_FUNCTION = """
+CREATE OR REPLACE FUNCTION sync_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO tombstone (table_name, row_id, retail_shop_id)
+    VALUES (TG_TABLE_NAME, OLD.id, coalesce(CAST(row_to_json(OLD)->>'retail_shop_id' AS uuid),
+            (SELECT retail_shop_id FROM product WHERE id = CAST(row_to_json(OLD)->>'product_id' AS uuid))));
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql
+"""
+
+SYNC_TRIGGERS = [TOMBSTONE_FUNCTION]
+for model in SYNC_MODELS:
+    SYNC_TRIGGERS.append('DROP TRIGGER IF EXISTS {0}_tombstone ON {0}'.format(model.__tablename__))
+    SYNC_TRIGGERS.append('CREATE TRIGGER {0}_tombstone AFTER DELETE ON {0} FOR EACH ROW EXECUTE PROCEDURE '
+                         'sync_tombstone()'.format(model.__tablename__))
+
+# After every table exists, the function inserts into tombstone.
+for statement in SYNC_TRIGGERS:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def create_sync_triggers():
+    # For databases created before the triggers were declared, create_all() adds them to new ones.
+    for statement in SYNC_TRIGGERS:
+        db.session.execute(statement)
+    db.session.commit()
+
+
+def prune_tombstones(days):
+    table = Tombstone.__table__
+    result = db.session.execute(table.delete().where(table.c.updated_on < func.localtimestamp() - timedelta(days=days)))
+    db.session.commit()
+    return result.rowcount
+
+
+def settled_until():
+    # updated_on holds the start of the writing transaction, not its commit, so the round stops where the oldest
+    # transaction that has written and not committed yet began. Readers, such as exports, hold no xid and are
+    # ignored; transactions about to write are covered by SYNC_SETTLE_SECONDS, requests write soon after they
+    # begin. A writer older than SYNC_MAX_LAG_SECONDS stops holding the terminals back.
+    config = current_app.config
+    now, oldest = db.session.execute('SELECT localtimestamp, CAST(min(xact_start) AS timestamp) FROM pg_stat_activity '
+                                     'WHERE datname = current_database() AND backend_xid IS NOT NULL '
+                                     'AND pid <> pg_backend_pid()').first()
+    until = now - timedelta(seconds=config['SYNC_SETTLE_SECONDS'])
+    if oldest is not None and oldest < until:
+        until = max(oldest, now - timedelta(seconds=config['SYNC_MAX_LAG_SECONDS']))
+        if until > oldest:
+            current_app.logger.warning('Catalog sync passed a transaction writing since %s, rows it commits with '
+                                       'an older updated_on are not sent', oldest)
+    return until
+
+
+def shop_criterion(table, retail_shop_id):
+    if 'retail_shop_id' in table.c:
+        return table.c.retail_shop_id == retail_shop_id
+    return table.c.product_id.in_(select([Product.id]).where(Product.retail_shop_id == retail_shop_id))
+
+
+def dump_row(row):
+    # ISO-8601 with microseconds rather than the HTTP dates of jsonify, updated_on is compared with the watermark.
+    data = dict(row)
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            data[key] = value.strftime(DATETIME_FORMAT)
+        elif isinstance(value, date):
+            data[key] = value.strftime(DATE_FORMAT)
+    return data
+
+
+def sync_catalog(retail_shop_id, token, limit, retention_days):
+    # A round sends the rows changed in [since, until) table by table, in pages of ``limit`` rows. The token
+    # of a page resumes the round after its last row, the one of the last page starts the next round at until.
+    if token:
+        shop, since, until, table_index, updated_on, row_id = decode_cursor(token, TOKEN_KEYS)
+        if shop != retail_shop_id:
+            raise CustomException(data={'since': token}, message='The watermark belongs to another shop',
+                                  operation='syncing catalog', status=400)
+    else:
+        since, until, table_index, updated_on, row_id = None, None, 0, None, None
+
+    reset = False
+    if until is None:
+        until = settled_until()
+        # Deletions older than the retention are gone, the terminal has to start over.
+        if since is not None and since < until - timedelta(days=retention_days):
+            since, reset = None, True
+
+    # A first sync has nothing to delete.
+    models = SYNC_MODELS + ((Tombstone,) if since is not None else ())
+    data, deleted, remaining = {}, {}, limit
+    while table_index < len(models):
+        table = models[table_index].__table__
+        criteria = [shop_criterion(table, retail_shop_id), table.c.updated_on < until]
+        if since is not None:
+            criteria.append(table.c.updated_on >= since)
+        if updated_on is not None:
+            criteria.append(keyset_filter([(table.c.updated_on, False), (table.c.id, False)], [updated_on, row_id]))
+        rows = db.session.execute(select([table]).where(and_(*criteria)).order_by(table.c.updated_on, table.c.id)
+                                  .limit(remaining)).fetchall()
+
+        if table is Tombstone.__table__:
+            for row in rows:
+                deleted.setdefault(row.table_name, []).append(row.row_id)
+        elif rows:
+            data[table.name] = [dump_row(row) for row in rows]
+        remaining -= len(rows)
+        if not remaining:
+            updated_on, row_id = rows[-1].updated_on, rows[-1].id
+            break
+        table_index, updated_on, row_id = table_index + 1, None, None
+
+    more = table_index < len(models)
+    if more:
+        watermark = encode_cursor(TOKEN_KEYS, [retail_shop_id, since, until, table_index, updated_on, row_id])
+    else:
+        watermark = encode_cursor(TOKEN_KEYS, [retail_shop_id, until, None, 0, None, None])
+    return {'data': data, 'deleted': deleted, 'watermark': watermark, 'more': more, 'reset': reset}
@@ -1,8 +1,16 @@
+from flask import make_response, request, current_app
+from flask_restful import Resource
+from flask_security import auth_token_required, current_user
+
 from src import BaseView, AssociationView
-from src import api
+from src import api, jsonify
+from src.utils.exceptions import CustomException
 from .resources import BrandResource, DistributorBillResource, DistributorResource, ProductResource, \
     ProductTaxResource, StockResource, TaxResource, TagResource, ComboResource, AddOnResource, SaltResource,\
     ProductDistributorResource, ProductTagResource, ProductSaltResource, BrandDistributorResource
+from .search import search_products, SearchTimeout
+from .barcodes import barcode_index
+from .sync import sync_catalog
 
 
 @api.register()
@@ -123,3 +131,82 @@ class BrandDistributorAssociationView(AssociationView):
     @classmethod
     def get_resource(cls):
         return BrandDistributorResource
+
+
+def shop_products_denied(retail_shop_id):
+    if not retail_shop_id:
+        return make_response(jsonify({'error': True, 'message': 'retail_shop_id is required'}), 400)
+    if not current_user.has_permission('view_product') or not current_user.has_shop_access(retail_shop_id):
+        return make_response(jsonify({'error': True, 'message': 'Forbidden Permission Denied'}), 403)
+
+
+class ProductSearchResource(Resource):
+
+    method_decorators = [auth_token_required]
+
+    def get(self):
+        retail_shop_id = request.args.get('retail_shop_id')
+        term = request.args.get('q', '')
+        denied = shop_products_denied(retail_shop_id)
+        if denied:
+            return denied
+
+        config = current_app.config
+        try:
+            limit = min(int(request.args.get('__limit', config['PRODUCT_SEARCH_LIMIT'])),
+                        config['PRODUCT_SEARCH_MAX_LIMIT'])
+        except ValueError:
+            return make_response(jsonify({'error': True, 'message': '__limit has to be a number'}), 400)
+        if limit < 1:
+            return make_response(jsonify({'error': True, 'message': '__limit has to be positive'}), 400)
+        try:
+            data = search_products(retail_shop_id, term, limit, config['PRODUCT_SEARCH_TIMEOUT'])
+        except SearchTimeout:
+            return make_response(jsonify({'error': True, 'message': 'Search took too long, refine the term'}), 503)
+        return make_response(jsonify({'success': True, 'data': data, 'total': len(data)}), 200)
+
+
+class ProductBarcodeResource(Resource):
+
+    method_decorators = [auth_token_required]
+
+    def get(self, barcode):
+        retail_shop_id = request.args.get('retail_shop_id')
+        denied = shop_products_denied(retail_shop_id)
+        if denied:
+            return denied
+        record = barcode_index.lookup(retail_shop_id, barcode)
+        if record is None:
+            return make_response(jsonify({'error': True, 'message': 'No product with barcode %s' % barcode}), 404)
+        return make_response(jsonify({'success': True, 'data': record}), 200)
+
+
+class CatalogSyncResource(Resource):
+
+    method_decorators = [auth_token_required]
+
+    def get(self):
+        retail_shop_id = request.args.get('retail_shop_id')
+        denied = shop_products_denied(retail_shop_id)
+        if denied:
+            return denied
+
+        config = current_app.config
+        try:
+            limit = min(int(request.args.get('__limit', config['SYNC_PAGE_SIZE'])), config['SYNC_MAX_PAGE_SIZE'])
+        except ValueError:
+            return make_response(jsonify({'error': True, 'message': '__limit has to be a number'}), 400)
+        if limit < 1:
+            return make_response(jsonify({'error': True, 'message': '__limit has to be positive'}), 400)
+        try:
+            page = sync_catalog(retail_shop_id, request.args.get('since'), limit, config['SYNC_TOMBSTONE_DAYS'])
+        except CustomException as e:
+            e.message['error'] = True
+            return make_response(jsonify(e.message), e.status)
+        page['success'] = True
+        return make_response(jsonify(page), 200)
+
+
+api.add_resource(ProductSearchResource, '/product/search', endpoint='product_search')
+api.add_resource(ProductBarcodeResource, '/product/barcode/<string:barcode>', endpoint='product_barcode')
+api.add_resource(CatalogSyncResource, '/sync/catalog', endpoint='catalog_sync')
@@ -0,0 +1,65 @@
+import hashlib
+from collections import namedtuple
+
+from flask import request, current_app, has_request_context, _request_ctx_stack
+from sqlalchemy import String, and_, cast, func, select
+
+from src import db
+from src.utils.cache import LocalCache, response_cache, on_commit
+from .models import UserPermission, UserRetailShop, UserRole, Permission, Role
+
+Authorization = namedtuple('Authorization', ['user_id', 'permissions', 'retail_shop_ids', 'roles'])
+
+AUTHORIZATION_TABLES = (UserPermission.__table__, UserRetailShop.__table__, UserRole.__table__,
+                        Permission.__table__, Role.__table__)
+
+_snapshots = LocalCache(max_size=4096)
+
+
+def load_authorization(user_id):
+    # Permission names, shop ids and role names of a user in a single round trip.
+    permissions, shops, roles = db.session.query(
+        select([func.array_agg(Permission.name)])
+        .where(and_(UserPermission.permission_id == Permission.id, UserPermission.user_id == user_id)).as_scalar(),
+        select([func.array_agg(cast(UserRetailShop.retail_shop_id, String))])
+        .where(UserRetailShop.user_id == user_id).as_scalar(),
+        select([func.array_agg(Role.name)])
+        .where(and_(UserRole.role_id == Role.id, UserRole.user_id == user_id)).as_scalar()).one()
+    return Authorization(user_id, frozenset(permissions or ()), frozenset(shops or ()), frozenset(roles or ()))
+
+
+def get_authorization(user_id):
+    # Loaded once per request and, when AUTHORIZATION_CACHE_TIMEOUT is set, kept per token for that long.
+    if not has_request_context():
+        return load_authorization(user_id)
+    # Kept on the request context like flask-login's user, g outlives the request when an app context is pushed.
+    ctx = _request_ctx_stack.top
+    snapshots = ctx.authorizations = getattr(ctx, 'authorizations', None) or {}
+    if user_id not in snapshots:
+        snapshots[user_id] = _cached_authorization(user_id)
+    return snapshots[user_id]
+
+
+def _cached_authorization(user_id):
+    timeout = current_app.config.get('AUTHORIZATION_CACHE_TIMEOUT')
+    token = request.headers.get(current_app.config['SECURITY_TOKEN_AUTHENTICATION_HEADER'])
+    # Other workers learn about changes through the table versions of the response cache, without it nothing is
+    # kept.
+    if not timeout or not token or not response_cache.enabled:
+        return load_authorization(user_id)
+
+    versions = tuple(response_cache.versions(AUTHORIZATION_TABLES))
+    key = (hashlib.sha1(token.encode('utf-8')).hexdigest(), user_id, versions)
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        snapshot = load_authorization(user_id)
+        _snapshots.set(key, snapshot, timeout)
+    return snapshot
+
+
+@on_commit
+def _invalidate_authorizations(tables):
+    if tables.intersection(AUTHORIZATION_TABLES):
+        _snapshots.clear()
+        if has_request_context():
+            _request_ctx_stack.top.authorizations = {}
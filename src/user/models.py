@@ -1,4 +1,4 @@
-from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgresql import UUID
 
 from flask_security import RoleMixin, UserMixin
@@ -148,23 +148,25 @@ class User(BaseMixin, db.Model, UserMixin, ReprMixin):
     permissions = db.relationship('Permission', back_populates='users', secondary='user_permission', lazy='dynamic')
     retail_shops = db.relationship('RetailShop', back_populates='users', secondary='user_retail_shop', lazy='dynamic')
 
+    @property
+    def authorization(self):
+        from .authorization import get_authorization
+        return get_authorization(self.id)
+
     @hybrid_property
     def retail_shop_ids(self):
-        return [i[0] for i in self.retail_shops.with_entities(RetailShop.id).all()]
+        return sorted(self.authorization.retail_shop_ids)
 
     @retail_shop_ids.expression
     def retail_shop_ids(self):
         from sqlalchemy import select
         return select([UserRetailShop.retail_shop_id]).where(UserRetailShop.user_id == self.id).label('retail_shop_ids').limit(1)
 
-    @hybrid_method
     def has_shop_access(self, shop_id):
-        return db.session.query(UserRetailShop.query.filter(UserRetailShop.retail_shop_id == shop_id,
-                                                            UserRetailShop.user_id == self.id).exists()).scalar()
+        return shop_id is not None and str(shop_id) in self.authorization.retail_shop_ids
 
-    @hybrid_method
     def has_permission(self, permission):
-        return db.session.query(self.permissions.filter(Permission.name == permission).exists()).scalar()
+        return permission in self.authorization.permissions
 
     @hybrid_property
     def is_owner(self):
@@ -197,6 +199,9 @@ class Customer(BaseMixin, db.Model, ReprMixin):
     orders = db.relationship('Order', uselist=True, lazy='dynamic')
     transactions = db.relationship('CustomerTransaction', uselist=True, lazy='dynamic')
 
+    __batch_fields__ = {'total_orders': 'batch_order_totals', 'total_billing': 'batch_order_totals',
+                        'amount_due': 'batch_order_totals'}
+
     @hybrid_property
     def total_orders(self):
         return self.orders.with_entities(func.coalesce(func.Count(Order.id), 0)).scalar()
@@ -211,6 +216,23 @@ class Customer(BaseMixin, db.Model, ReprMixin):
                                          func.coalesce(func.Sum(Order.amount_paid), 0)).scalar() - \
                self.transactions.with_entities(func.coalesce(func.Sum(CustomerTransaction.amount), 0)).scalar()
 
+    @classmethod
+    def batch_order_totals(cls, objects):
+        ids = [obj.id for obj in objects]
+        orders = {row[0]: row[1:] for row in db.session.query(Order.customer_id, func.Count(Order.id),
+                                                              func.coalesce(func.Sum(Order.total), 0),
+                                                              func.coalesce(func.Sum(Order.total), 0) -
+                                                              func.coalesce(func.Sum(Order.amount_paid), 0))
+                  .filter(Order.customer_id.in_(ids)).group_by(Order.customer_id).all()}
+        paid = dict(db.session.query(CustomerTransaction.customer_id, func.Sum(CustomerTransaction.amount))
+                    .filter(CustomerTransaction.customer_id.in_(ids)).group_by(CustomerTransaction.customer_id).all())
+        values = {}
+        for obj in objects:
+            total_orders, total_billing, due = orders.get(obj.id, (0, 0, 0))
+            values[obj.id] = {'total_orders': total_orders, 'total_billing': total_billing,
+                              'amount_due': due - paid.get(obj.id, 0)}
+        return values
+
 
 class CustomerTransaction(BaseMixin, db.Model, ReprMixin):
 
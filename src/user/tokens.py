@@ -0,0 +1,124 @@
+import hashlib
+
+from flask import current_app
+from flask_login import UserMixin as LoginUserMixin
+from flask_security import RoleMixin
+from flask_security.core import _token_loader
+from itsdangerous import URLSafeTimedSerializer, BadData
+
+from src import db
+from src.utils.cache import LocalCache, response_cache, on_commit, redis
+from .authorization import get_authorization
+from .models import User, UserRole, UserRetailShop
+
+TOKEN_SALT = 'stateless-auth-token'
+
+VERSION_TABLES = (User.__table__, UserRole.__table__, UserRetailShop.__table__)
+
+_versions = LocalCache(max_size=4096)
+
+
+class TokenRole(RoleMixin):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class TokenUser(LoginUserMixin):
+    # Stands in for the User row of a verified token. Authorization comes from the snapshot, anything else
+    # loads the row on first use.
+
+    active = True
+
+    def __init__(self, user_id, retail_brand_id):
+        self.id = user_id
+        self.retail_brand_id = retail_brand_id
+        self._user = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = User.query.get(self.id)
+        return getattr(self._user, name)
+
+    @property
+    def authorization(self):
+        return get_authorization(self.id)
+
+    @property
+    def roles(self):
+        return [TokenRole(name) for name in sorted(self.authorization.roles)]
+
+    @property
+    def retail_shop_ids(self):
+        return sorted(self.authorization.retail_shop_ids)
+
+    def has_role(self, role):
+        return (role if isinstance(role, str) else role.name) in self.authorization.roles
+
+    def has_permission(self, permission):
+        return permission in self.authorization.permissions
+
+    def has_shop_access(self, shop_id):
+        return shop_id is not None and str(shop_id) in self.authorization.retail_shop_ids
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+
+def token_version(user_id):
+    # Digest of what a token vouches for: changing the password, brand, roles or shops or deactivating the user
+    # revokes every token issued before.
+    versions = tuple(response_cache.versions(VERSION_TABLES)) if response_cache.enabled else ()
+    key = (user_id, versions)
+    version = _versions.get(key)
+    if version is None:
+        row = db.session.query(User.password, User.active, User.retail_brand_id).filter(User.id == user_id).first()
+        if row is None or not row.active:
+            return None
+        authorization = get_authorization(user_id)
+        scope = [row.password, str(row.retail_brand_id)] + sorted(authorization.retail_shop_ids) + \
+            sorted(authorization.roles)
+        version = hashlib.md5('|'.join(scope).encode('utf-8')).hexdigest()
+        _versions.set(key, version, current_app.config['AUTH_TOKEN_VERSION_TIMEOUT'])
+    return version
+
+
+def issue_token(user):
+    return _serializer().dumps({'id': user.id, 'brand': user.retail_brand_id, 'version': token_version(user.id)})
+
+
+def load_token(token):
+    # Tokens issued by flask-security itself keep working until they expire.
+    try:
+        data = _serializer().loads(token, max_age=current_app.config['MAX_AGE'])
+    except (BadData, TypeError):
+        return _token_loader(token)
+    if data.get('version') is None or data.get('version') != token_version(data.get('id')):
+        return current_app.login_manager.anonymous_user()
+    return TokenUser(data['id'], data.get('brand'))
+
+
+class StatelessTokens(object):
+
+    def init_app(self, app):
+        app.config.setdefault('STATELESS_AUTH_TOKENS', False)
+        app.config.setdefault('AUTH_TOKEN_VERSION_TIMEOUT', 60)
+        shared = app.config.get('RESPONSE_CACHE_BACKEND') == 'redis' and redis is not None
+        if app.config['STATELESS_AUTH_TOKENS'] and not shared:
+            # Other workers would only see a revocation once their cached version expires.
+            app.logger.warning('STATELESS_AUTH_TOKENS needs the redis response cache, stateless tokens are off')
+            app.config['STATELESS_AUTH_TOKENS'] = False
+        if app.config['STATELESS_AUTH_TOKENS']:
+            app.login_manager.token_callback = load_token
+
+
+stateless_tokens = StatelessTokens()
+
+
+@on_commit
+def _invalidate_versions(tables):
+    if tables.intersection(VERSION_TABLES):
+        _versions.clear()
@@ -1,7 +1,7 @@
 from flask_restful import Resource
 from flask_security.utils import verify_and_update_password, login_user
-from flask import request, jsonify, make_response, redirect
-from src import BaseView, AssociationView
+from flask import request, make_response, redirect, current_app
+from src import BaseView, AssociationView, jsonify
 from src.utils.methods import List
 from .resources import UserResource, UserRoleResource, RoleResource,\
     RetailBrandResource, RetailShopResource, UserRetailShopResource, CustomerResource, AddressResource,\
@@ -9,6 +9,7 @@ from .resources import UserResource, UserRoleResource, RoleResource,\
     UserPermissionResource, PermissionResource, PrinterConfigResource, RegistrationDetailResource
 from src import api
 from .models import User
+from .tokens import issue_token
 
 
 @api.register()
@@ -90,7 +91,8 @@ class UserLoginResource(Resource):
 
             user = self.model.query.filter(self.model.email == data['email']).first()
             if user and verify_and_update_password(data['password'], user) and login_user(user):
-
+                if current_app.config['STATELESS_AUTH_TOKENS']:
+                    return jsonify({'id': user.id, 'authentication_token': issue_token(user)})
                 return jsonify({'id': user.id, 'authentication_token': user.get_auth_token()})
             else:
                 return make_response(jsonify({'meta': {'code': 403}}), 403)
@@ -1,9 +1,11 @@
-from .api import api, BaseView, AssociationView
+from .api import api, BaseView, AssociationView, jsonify
 from .models import db, ReprMixin, BaseMixin
 from .factory import create_app
 from .schema import ma, BaseSchema
 from .blue_prints import bp
 from .admin import admin
 from .resource import ModelResource, AssociationModelResource
-
+from .cache import response_cache, mark_changed
+from .instrumentation import QueryBudgetExceeded
+from .metrics import metrics
 
@@ -1,19 +1,41 @@
 import re
+import json
+import zlib
+from uuid import UUID
+from decimal import Decimal
+from datetime import date
 from typing import TypeVar
 from abc import abstractproperty
+from functools import wraps
 
 from flask_restful import Api
 from flask_restful import Resource
-from flask import request, jsonify, make_response
+from flask import request, make_response, current_app
+from werkzeug.http import http_date
 from flask_security import auth_token_required, roles_accepted, roles_required
-from flask_excel import make_response_from_records
 
 from .models import db
+from .schema import get_schema
 from .blue_prints import bp
 from .resource import ModelResource, AssociationModelResource
+from .pagination import paginate, count_rows
+from .export import export_response
+from .cache import response_cache
+from .metrics import metrics
+from .profiler import PROFILERS
 from .exceptions import ResourceNotFound, SQLIntegrityError, SQlOperationalError, CustomException
 from .methods import BulkUpdate, List, Fetch, Create, Delete, Update
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 ModelResourceType = TypeVar('ModelResourceType', bound=ModelResource)
 AssociationModelResource = TypeVar('AssociationModelResource', bound=AssociationModelResource)
 
@@ -52,9 +74,142 @@ class ApiFactory(Api):
 api = ApiFactory(bp)
 
 
+def json_default(o):
+    # Same conversions as flask's JSONEncoder, plus Decimal.
+    if isinstance(o, date):
+        return http_date(o.timetuple())
+    if isinstance(o, UUID):
+        return str(o)
+    if isinstance(o, Decimal):
+        return float(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError('%r is not JSON serializable' % o)
+
+
+def dumps(data):
+    # The same bytes with or without orjson: compact, utf-8 rather than \u escapes.
+    sort_keys = current_app.config['JSON_SORT_KEYS']
+    if current_app.debug and current_app.config['JSONIFY_PRETTYPRINT_REGULAR']:
+        return json.dumps(data, default=json_default, sort_keys=sort_keys, indent=2, separators=(', ', ': '))
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=json_default,
+                                option=orjson.OPT_PASSTHROUGH_DATETIME | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+        except TypeError:
+            pass
+    return json.dumps(data, default=json_default, sort_keys=sort_keys, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+
+def jsonify(*args, **kwargs):
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else args or kwargs
+    body = dumps(data)
+    body += b'\n' if isinstance(body, bytes) else '\n'
+    return current_app.response_class(body, mimetype='application/json')
+
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    response = jsonify(data)
+    response.status_code = code
+    response.headers.extend(headers or {})
+    return response
+
+
+def accepted_encoding():
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(encodings)
+
+
+def compressor(encoding):
+    if encoding == 'br':
+        br = brotli.Compressor(quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+        return br.process, br.flush, br.finish
+    gzip = zlib.compressobj(current_app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+    return gzip.compress, lambda: gzip.flush(zlib.Z_SYNC_FLUSH), gzip.flush
+
+
+def compress_chunks(chunks, encoding, charset):
+    # Every chunk is flushed as it comes so that streamed exports stay incremental on the client side.
+    process, flush, finish = compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            if chunk:
+                yield process(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+@bp.after_request
+def compress_response(response):
+    if not current_app.config['COMPRESS_RESPONSES'] or response.status_code < 200 or \
+            response.status_code in (204, 304) or 'Content-Encoding' in response.headers or \
+            response.mimetype not in current_app.config['COMPRESS_MIMETYPES']:
+        return response
+
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding, response.charset)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        process, flush, finish = compressor(encoding)
+        response.set_data(process(data) + finish())
+
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def not_modified(etag):
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def with_etag(response, etag):
+    # Weak, the validator describes the data and not the bytes, which change with the content encoding.
+    if etag is not None and response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def profiled(roles):
+    # ``?__profile=1`` answers with a cProfile breakdown and the SQL run, ``?__profile=collapsed`` with sampled
+    # stacks for flamegraph.pl / speedscope, instead of the normal body.
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            profiler = PROFILERS.get(request.args.get('__profile'))
+            if profiler is None:
+                return view(*args, **kwargs)
+
+            @roles_accepted(*roles)
+            def profile():
+                report = profiler(view, *args, **kwargs)[1]
+                return current_app.response_class(report, mimetype='text/plain')
+            return profile()
+        return wrapper
+    return decorator
+
+
 class BaseView(Resource):
 
     api_methods = [BulkUpdate, List, Fetch, Create, Delete, Update]
+    profile_roles = ('admin',)
 
     def __init__(self):
         if self.get_resource() is not None:
@@ -67,42 +222,81 @@ class BaseView(Resource):
         pass
 
     def add_method_decorator(self):
-        self.method_decorators = []
+        self.method_decorators = [profiled(self.profile_roles)]
         if self.resource.auth_required:
             self.method_decorators.append(roles_required(*[i for i in self.resource.roles_required]))
             self.method_decorators.append(roles_accepted(*[i for i in self.resource.roles_accepted]))
             self.method_decorators.append(auth_token_required)
 
     def get(self, slug=None):
+        schema = get_schema(self.resource.schema, self.resource.obj_only, self.resource.obj_exclude)
+        cache_key = None
+        if '__export__' not in request.args and '__profile' not in request.args:
+            cache_key = self.resource.cache_key(schema)
+        if cache_key is not None:
+            cached = response_cache.get(cache_key)
+            metrics.inc('response_cache_requests_total', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                data, etag = cached
+                if not_modified(etag):
+                    return with_etag(make_response('', 304), etag)
+                return with_etag(current_app.response_class(data, mimetype='application/json'), etag)
+
+        response = self.read(schema, slug)
+        if cache_key is not None and response.status_code == 200:
+            response_cache.set(cache_key, (response.get_data(), response.get_etag()[0]),
+                               self.resource.cache_timeout)
+        return response
+
+    def read(self, schema, slug=None):
         if slug:
             obj = self.resource.model.query.filter(self.resource.model.id == slug)
-            obj = self.resource.has_read_permission(obj).first()
+            obj = self.resource.has_read_permission(obj)
+            etag = self.resource.get_etag(obj, schema)
+            if not_modified(etag):
+                return with_etag(make_response('', 304), etag)
+            obj = self.resource.apply_loading(obj, schema).first()
             if obj:
-                return make_response(jsonify(self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                  only=tuple(self.resource.obj_only)).dump(
-                    obj, many=False).data), 200)
+                self.resource.load_related([obj])
+                return with_etag(make_response(jsonify(self.resource.dump(schema, obj, many=False)), 200), etag)
 
             return make_response(jsonify({'error': True, 'message': 'Resource not found'}), 404)
 
         else:
             objects = self.resource.apply_filters(queryset=self.resource.model.query, **request.args)
             objects = self.resource.has_read_permission(objects)
+            etag = None
+            if '__export__' not in request.args:
+                etag = self.resource.get_etag(objects, schema)
+                if not_modified(etag):
+                    return with_etag(make_response('', 304), etag)
+            queryset = self.resource.apply_loading(objects, schema)
+
+            if self.resource.cursor is not None:
+                try:
+                    items, next_cursor = self.resource.apply_cursor(queryset, request.args.get('__order_by'))
+                except CustomException as e:
+                    e.message['error'] = True
+                    return make_response(jsonify(e.message), e.status)
+                if items:
+                    return with_etag(make_response(jsonify({
+                        'success': True, 'data': self.resource.dump(schema, self.resource.load_related(items)),
+                        'next_cursor': next_cursor, 'total': count_rows(objects, self.resource.total)}), 200), etag)
+                return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
 
             if '__order_by' in request.args:
-                objects = self.resource.apply_ordering(objects, request.args['__order_by'])
+                queryset = self.resource.apply_ordering(queryset, request.args['__order_by'])
 
             if '__export__' in request.args and self.resource.export is True:
-                objects = objects.paginate(page=self.resource.page, per_page=self.resource.max_export_limit)
-                return make_response_from_records(
-                    self.resource.schema(exclude=tuple(self.resource.obj_exclude), only=tuple(self.resource.obj_only))
-                        .dump(objects.items, many=True).data, 'csv', 200,  self.resource.model.__name__)
+                return export_response(self.resource.export_queryset(queryset), schema, request.args['__export__'],
+                                       self.resource.model.__name__, self.resource.export_chunk_size,
+                                       self.resource.load_related, self.resource.dump)
 
-            resources = objects.paginate(page=self.resource.page, per_page=self.resource.limit)
+            resources = paginate(queryset, self.resource.page, self.resource.limit, self.resource.total)
             if resources.items:
-                return make_response(jsonify({'success': True,
-                                              'data': self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                           only=tuple(self.resource.obj_only))
-                                             .dump(resources.items, many=True).data, 'total': resources.total}), 200)
+                return with_etag(make_response(jsonify({
+                    'success': True, 'data': self.resource.dump(schema, self.resource.load_related(resources.items)),
+                    'total': resources.total}), 200), etag)
             return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
 
     def post(self):
@@ -171,13 +365,12 @@ class AssociationView(Resource):
             self.method_decorators.append(auth_token_required)
 
     def get(self, slug=None):
+        schema = get_schema(self.resource.schema, self.resource.obj_only, self.resource.obj_exclude)
         if slug:
             obj = self.resource.model.query.filter(self.resource.model.id == slug)
             obj = self.resource.has_read_permission(obj).first()
             if obj:
-                return make_response(jsonify(self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                  only=tuple(self.resource.obj_only)).dump(
-                    obj, many=False).data), 200)
+                return make_response(jsonify(schema.dump(obj, many=False).data), 200)
 
             return make_response(jsonify({'error': True, 'message': 'Resource not found'}), 404)
 
@@ -187,16 +380,24 @@ class AssociationView(Resource):
 
             if '__order_by' in request.args:
                 objects = self.resource.apply_ordering(objects, request.args['__order_by'])
-            resources = objects.paginate(page=self.resource.page, per_page=self.resource.limit)
+            resources = paginate(objects, self.resource.page, self.resource.limit, self.resource.total)
             if resources.items:
                 return make_response(jsonify({'success': True,
-                                              'data': self.resource.schema(exclude=tuple(self.resource.obj_exclude),
-                                                                           only=tuple(self.resource.obj_only))
-                                             .dump(resources.items, many=True).data, 'total': resources.total}), 200)
+                                              'data': schema.dump(resources.items, many=True).data,
+                                              'total': resources.total}), 200)
             return make_response(jsonify({'error': True, 'message': 'No Resource Found'}), 404)
 
     def post(self):
         data = request.json if isinstance(request.json, list) else [request.json]
+        if self.resource.bulk_relations:
+            try:
+                self.resource.apply_relations(data)
+            except (ResourceNotFound, SQLIntegrityError, SQlOperationalError, CustomException) as e:
+                db.session.rollback()
+                e.message['error'] = True
+                return make_response(jsonify(e.message), e.status)
+            return make_response(jsonify({'success': True, 'message': 'Updated Successfully', 'data': data}), 200)
+
         for d in data:
             try:
                 db.session.begin_nested()
@@ -0,0 +1,70 @@
+from collections import defaultdict
+from uuid import uuid4, UUID
+
+from sqlalchemy import inspect, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import db
+
+
+def bind_uuids(obj):
+    # ma.UUID loads uuid.UUID objects, psycopg2 only binds strings to UUID columns. Setting a key back to the string
+    # it was loaded from is no change, the row is not rewritten.
+    state = inspect(obj)
+    for prop in state.mapper.column_attrs:
+        if isinstance(state.dict.get(prop.key), UUID):
+            setattr(obj, prop.key, str(state.dict[prop.key]))
+
+
+def bulk_insert(model, objects, batch_size=1000):
+    # Multi row INSERT ... VALUES with ids generated here, so no row needs a RETURNING round trip. Objects that
+    # carry relationship changes still go through the session, which knows how to save them. They are flushed here,
+    # once every plain row is in, so the rows they and their children point to already exist.
+    mapper = inspect(model)
+    table = mapper.local_table
+    ids = []
+    rows = defaultdict(list)
+    related = []
+    for obj in objects:
+        state = inspect(obj)
+        bind_uuids(obj)
+        if obj.id is None:
+            obj.id = str(uuid4())
+        ids.append(obj.id)
+
+        if any(state.attrs[prop.key].history.has_changes() for prop in mapper.relationships):
+            related.append(obj)
+            continue
+        if state.session_id is not None:
+            # Pulled into the session by a backref cascade while loading, it would be flushed a second time.
+            db.session.expunge(obj)
+
+        # Every column that was loaded, explicit nulls included. Omitted columns fall back to their defaults, rows
+        # are grouped so that every statement has one shape.
+        row = {prop.columns[0].key: state.dict[prop.key] for prop in mapper.column_attrs if prop.key in state.dict}
+        rows[frozenset(row)].append(row)
+
+    for group in rows.values():
+        for start in range(0, len(group), batch_size):
+            db.session.execute(table.insert().values(group[start:start + batch_size]))
+    if related:
+        db.session.add_all(related)
+        db.session.flush()
+    return ids
+
+
+def insert_relations(model, keys, pairs, batch_size=1000):
+    # Pairs that already exist are skipped by the unique constraint on ``keys``.
+    table = model.__table__
+    pairs = list(pairs)
+    for start in range(0, len(pairs), batch_size):
+        rows = [dict(zip(keys, pair)) for pair in pairs[start:start + batch_size]]
+        db.session.execute(insert(table).values(rows).on_conflict_do_nothing(index_elements=list(keys)))
+
+
+def delete_relations(model, keys, pairs, batch_size=1000):
+    table = model.__table__
+    pairs = list(pairs)
+    for start in range(0, len(pairs), batch_size):
+        db.session.execute(table.delete().where(tuple_(*[table.c[key] for key in keys])
+                                                .in_(pairs[start:start + batch_size])))
@@ -0,0 +1,178 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .models import db
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LocalCache(object):
+    # In process LRU with expiry. Versions are kept apart from the entries so that evicting an entry can never
+    # bring an older version back; invalidations only reach the process that committed, use redis with workers.
+
+    def __init__(self, max_size=1024, timeout=300):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + (timeout or self.timeout))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def versions(self, names):
+        with self._lock:
+            return [self._versions.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class RedisCache(object):
+
+    def __init__(self, client, prefix='pos:', timeout=300):
+        self.client = client
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=timeout or self.timeout)
+
+    def versions(self, names):
+        if not names:
+            return []
+        return [int(value or 0) for value in self.client.mget([self.prefix + 'version:' + name for name in names])]
+
+    def bump(self, names):
+        pipeline = self.client.pipeline()
+        for name in names:
+            pipeline.incr(self.prefix + 'version:' + name)
+        pipeline.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache(object):
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', None)
+        app.config.setdefault('RESPONSE_CACHE_TIMEOUT', 300)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        app.config.setdefault('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('RESPONSE_CACHE_PREFIX', 'pos:')
+
+        backend = app.config['RESPONSE_CACHE_BACKEND']
+        if backend == 'redis' and redis is None:
+            # Not the local backend instead, the other workers would go on serving what this one invalidated.
+            app.logger.warning('RESPONSE_CACHE_BACKEND "redis" needs the redis package, response caching is off')
+            backend = None
+        if backend == 'redis':
+            self.backend = RedisCache(redis.StrictRedis.from_url(app.config['RESPONSE_CACHE_REDIS_URL']),
+                                      app.config['RESPONSE_CACHE_PREFIX'], app.config['RESPONSE_CACHE_TIMEOUT'])
+        elif backend == 'local':
+            self.backend = LocalCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TIMEOUT'])
+        else:
+            self.backend = None
+        app.extensions['response_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @property
+    def shared(self):
+        # Seen by every worker, not only by the process that wrote it.
+        return isinstance(self.backend, RedisCache)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    def versions(self, tables):
+        return self.backend.versions([table.name for table in tables])
+
+    def invalidate(self, tables):
+        if self.enabled and tables:
+            self.backend.bump(sorted({table.name for table in tables}))
+
+
+response_cache = ResponseCache()
+
+_commit_hooks = []
+
+
+def on_commit(hook):
+    # ``hook(tables)`` runs after every commit that changed rows, for caches kept outside of the response cache.
+    _commit_hooks.append(hook)
+    return hook
+
+
+def mark_changed(*models):
+    # For writes that never reach the unit of work, e.g. Query.update() or core statements.
+    db.session.info.setdefault('changed_tables', set()).update(model.__table__ for model in models)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    tables = session.info.setdefault('changed_tables', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        state = inspect(obj)
+        tables.update(state.mapper.tables)
+        for prop in state.mapper.relationships:
+            if prop.secondary is not None and state.attrs[prop.key].history.has_changes():
+                tables.add(prop.secondary)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changes(session):
+    # Bumped once the rows are visible to other connections, a rolled back flush is simply invalidated
+    # with the next commit of the session.
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        response_cache.invalidate(tables)
+        for hook in _commit_hooks:
+            hook(tables)
@@ -0,0 +1,61 @@
+import csv
+from io import StringIO
+
+from flask import Response, stream_with_context, json
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def iter_chunks(queryset, chunk_size, load_related=None):
+    # yield_per runs the query through a server side cursor (stream_results) on psycopg2, so only
+    # one chunk of rows is ever held by the process.
+    chunk = []
+    for obj in queryset.yield_per(chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield load_related(chunk) if load_related else chunk
+            chunk = []
+    if chunk:
+        yield load_related(chunk) if load_related else chunk
+
+
+def _dump(schema, objects, dump=None):
+    if dump is not None:
+        return dump(schema, objects)
+    return schema.dump(objects, many=True).data
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def generate_csv(queryset, schema, chunk_size, load_related=None, dump=None):
+    fields = [name for name, field in schema.fields.items() if not field.load_only]
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for chunk in iter_chunks(queryset, chunk_size, load_related):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in _dump(schema, chunk, dump):
+            writer.writerow({key: _csv_value(value) for key, value in row.items()})
+        yield buffer.getvalue()
+
+
+def generate_ndjson(queryset, schema, chunk_size, load_related=None, dump=None):
+    for chunk in iter_chunks(queryset, chunk_size, load_related):
+        yield ''.join(json.dumps(row) + '\n' for row in _dump(schema, chunk, dump))
+
+
+def export_response(queryset, schema, export_format, file_name, chunk_size, load_related=None, dump=None):
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    generator = generate_ndjson if export_format == 'ndjson' else generate_csv
+
+    return Response(stream_with_context(generator(queryset, schema, chunk_size, load_related, dump)),
+                    mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': 'attachment; filename=%s.%s' % (file_name, export_format)})
@@ -1,6 +1,8 @@
 from flask import Flask
 from flask_cors import CORS
 
+from .metrics import metrics
+
 
 def create_app(package_name, config, blueprints=None, extensions=None):
     app = Flask(package_name)
@@ -14,5 +16,6 @@ def create_app(package_name, config, blueprints=None, extensions=None):
         for extension in extensions:
 
             extension.init_app(app)
+    metrics.init_app(app)
 
     return app
@@ -0,0 +1,107 @@
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from flask import request, current_app, has_request_context, _request_ctx_stack
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .blue_prints import bp
+
+PARAMETERS = re.compile(r'%\(\w+\)s|%s|\?')
+PARAMETER_LISTS = re.compile(r'\((\?, )+\?\)')
+
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats(object):
+
+    def __init__(self, trace=False):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.queries = []
+        self.trace = trace
+
+    def record(self, statement, started, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+        self.queries.append((statement, started, duration, query_origin() if self.trace else None))
+
+    def repeated(self, threshold):
+        return {statement: count for statement, count in self.fingerprints.items() if count >= threshold}
+
+
+def fingerprint(statement):
+    # Bound parameters and IN lists of any length collapse to one shape, so a loop shows up as one statement.
+    return PARAMETER_LISTS.sub('(?...)', PARAMETERS.sub('?', ' '.join(statement.split())))
+
+
+def query_origin():
+    # Innermost frame of our own code the statement was run from, e.g. a hybrid property in a models module.
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SOURCE_ROOT) and os.path.abspath(filename) != os.path.abspath(__file__):
+            return '%s:%d %s' % (os.path.relpath(filename, os.path.dirname(SOURCE_ROOT)), frame.f_lineno,
+                                 frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+def query_stats():
+    ctx = _request_ctx_stack.top
+    return getattr(ctx, 'query_stats', None) if ctx is not None else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    stats = query_stats() if has_request_context() else None
+    if stats is not None:
+        stats.record(statement, started, time.perf_counter() - started)
+
+
+@bp.before_request
+def start_query_stats():
+    _request_ctx_stack.top.query_stats = QueryStats()
+
+
+@bp.after_request
+def report_query_stats(response):
+    stats = query_stats()
+    if stats is None:
+        return response
+    config = current_app.config
+    repeated = stats.repeated(config['QUERY_REPEAT_THRESHOLD'])
+    if repeated:
+        current_app.logger.warning('%s ran %d repeated statements: %s', request.path, len(repeated),
+                                   '; '.join('%dx %s' % (count, statement[:200])
+                                             for statement, count in repeated.items()))
+
+    if config['QUERY_STATS_HEADERS']:
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time'] = '%.2f' % (stats.duration * 1000)
+        response.headers['X-Query-Repeated'] = str(len(repeated))
+
+    endpoint = (request.endpoint or '').rsplit('.', 1)[-1]
+    budget = config['QUERY_BUDGETS'].get(endpoint, config['QUERY_BUDGET_DEFAULT'])
+    if request.method == 'GET' and budget is not None and stats.count > budget:
+        message = '%s %s ran %d queries, the budget for %s is %d' % (request.method, request.full_path, stats.count,
+                                                                     endpoint, budget)
+        if config['QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
@@ -0,0 +1,164 @@
+from collections import defaultdict
+
+from marshmallow import fields
+from marshmallow_sqlalchemy.fields import Related
+from sqlalchemy import inspect, func
+from sqlalchemy.orm import joinedload, aliased, Load
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import db
+
+SKIP_LAZY = ('dynamic', 'noload', 'raise')
+
+
+def plan_loads(model, schema, depth):
+    # [(relationship, [nested plan])] for every relationship the schema is going to dump.
+    mapper = inspect(model)
+    plan = []
+    for name, field in schema.fields.items():
+        if field.load_only or not isinstance(field, (fields.Nested, Related)):
+            continue
+        prop = mapper.relationships.get(field.attribute or name)
+        if prop is None or prop.lazy in SKIP_LAZY:
+            continue
+        nested = []
+        if isinstance(field, fields.Nested) and depth > 1:
+            nested = plan_loads(prop.mapper.class_, field.schema, depth - 1)
+        plan.append((prop, nested))
+    return plan
+
+
+def planned_paths(plan, parent=()):
+    # Every relationship path of a plan, from the model the plan starts at.
+    paths = []
+    for prop, nested in plan:
+        path = parent + (prop,)
+        paths.append(path)
+        paths.extend(planned_paths(nested, path))
+    return paths
+
+
+def resolve_path(model, path):
+    # 'brand.distributors' to the relationships it goes through, every prefix is returned as a path as well.
+    mapper, props, paths = inspect(model), (), []
+    for key in path.split('.'):
+        prop = mapper.relationships[key]
+        props += (prop,)
+        paths.append(props)
+        mapper = prop.mapper
+    return paths
+
+
+def path_tables(paths):
+    # Tables the paths read from, association tables included so that unlinking a row changes the validator.
+    tables = set()
+    for path in paths:
+        tables.add(path[-1].mapper.local_table)
+        if path[-1].secondary is not None:
+            tables.add(path[-1].secondary)
+    return tables
+
+
+def path_aggregates(model, path, ids):
+    # max(updated_on) and count of the rows reached through ``path`` from the rows with ``ids``, joined along the
+    # foreign keys so that writes to other rows, e.g. of other shops, leave them alone.
+    # Joined on the relationship conditions rather than the attributes, which alias association tables; a path
+    # visits every table once.
+    query = db.session.query(model).filter(model.id.in_(ids))
+    for prop in path:
+        if prop.secondary is not None:
+            query = query.join(prop.secondary, prop.primaryjoin).join(prop.mapper.local_table, prop.secondaryjoin)
+        else:
+            query = query.join(prop.mapper.local_table, prop.primaryjoin)
+    columns = [func.count()]
+    if 'updated_on' in path[-1].mapper.local_table.c:
+        columns.append(func.max(path[-1].mapper.local_table.c.updated_on))
+    if path[-1].secondary is not None and 'updated_on' in path[-1].secondary.c:
+        columns.append(func.max(path[-1].secondary.c.updated_on))
+    return [query.with_entities(column).as_scalar() for column in columns]
+
+
+def projection(model, schema):
+    # Column attributes the dumped fields read, or None when a field can not be traced back to columns.
+    mapper = inspect(model)
+    dependencies = getattr(model, '__column_dependencies__', {})
+    columns = {column.key for column in mapper.primary_key}
+    for name, field in schema.fields.items():
+        if field.load_only:
+            continue
+        attribute = field.attribute or name
+        if attribute in mapper.column_attrs:
+            columns.add(attribute)
+        elif attribute in mapper.relationships:
+            columns.update(mapper.get_property_by_column(column).key
+                           for column in mapper.relationships[attribute].local_columns)
+        elif attribute in dependencies:
+            columns.update(dependencies[attribute])
+        else:
+            return None
+    return columns
+
+
+def joined_options(plan, parent=None):
+    # Many to one relationships are joined into the main query, collections are left to load_collections.
+    options = []
+    for prop, nested in plan:
+        if prop.uselist:
+            continue
+        option = joinedload(prop.key) if parent is None else parent.joinedload(prop.key)
+        options.append(option)
+        options.extend(joined_options(nested, option))
+    return options
+
+
+def load_collections(objects, plan):
+    # Fills every planned collection with one IN query per relationship, the same thing selectinload does
+    # on newer SQLAlchemy releases, and it also works with limit/offset and yield_per queries.
+    for prop, nested in plan:
+        if prop.uselist:
+            related = _load_collection(objects, prop, nested)
+        else:
+            related = [getattr(obj, prop.key) for obj in objects]
+        related = list({id(obj): obj for obj in related if obj is not None}.values())
+        if related and nested:
+            load_collections(related, nested)
+    return objects
+
+
+def _load_collection(objects, prop, nested):
+    if not objects:
+        return []
+    parent = prop.parent.class_
+    primary_key = inspect(parent).primary_key[0]
+    target = aliased(prop.mapper.class_)
+
+    queryset = db.session.query(primary_key, target).select_from(parent).join(target, getattr(parent, prop.key))\
+        .filter(primary_key.in_({getattr(obj, primary_key.key) for obj in objects}))\
+        .options(*joined_options(nested, Load(target)))
+
+    values = defaultdict(list)
+    related = []
+    for parent_id, obj in queryset:
+        values[parent_id].append(obj)
+        related.append(obj)
+
+    for obj in objects:
+        set_committed_value(obj, prop.key, values.get(getattr(obj, primary_key.key), []))
+    return related
+
+
+def resolve_batch_fields(model, objects, field_names):
+    # Models map per row hybrids to ``batch_*`` classmethods in ``__batch_fields__``; every resolver runs one
+    # grouped query for the whole page and its values are read back by BaseSchema.get_attribute.
+    batch_fields = getattr(model, '__batch_fields__', {})
+    resolvers = {batch_fields[name] for name in field_names if name in batch_fields}
+    if not objects or not resolvers:
+        return objects
+
+    for obj in objects:
+        obj._batch_values = {}
+    for resolver in resolvers:
+        values = getattr(model, resolver)(objects)
+        for obj in objects:
+            obj._batch_values.update(values.get(obj.id, {}))
+    return objects
@@ -0,0 +1,249 @@
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Response, request, abort, current_app, _request_ctx_stack
+
+from .models import db
+
+ARCHIVE = 'archive.json'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'api_requests_total': 'API requests by endpoint, method and status.',
+    'api_request_duration_seconds': 'API request latency by endpoint.',
+    'api_request_queries_total': 'SQL statements run by API requests, by endpoint.',
+    'db_pool_size': 'Connections the pool keeps open.',
+    'db_pool_checked_out': 'Connections currently in use.',
+    'db_pool_overflow': 'Connections opened above the pool size.',
+    'response_cache_requests_total': 'Response cache lookups by result.',
+}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{%s}' % ','.join('%s="%s"' % (key, escape(value)) for key, value in pairs)
+
+
+class Metrics(object):
+    # Counters and histograms of one process. With METRICS_DIR set every worker writes its values to
+    # <pid>.json there and /metrics sums the files, so a scrape sees all gunicorn workers whichever one answers.
+    # Counters and histograms of workers that exited are folded into archive.json, their gauges are dropped.
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.directory = None
+        self.flush_interval = 5
+        self.last_flush = 0
+        self.pid = None
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 5)
+        app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+        app.config.setdefault('METRICS_ALLOWED_IPS', ())
+        if not app.config['METRICS_ENABLED']:
+            return
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.add_url_rule('/metrics', 'metrics', self.expose)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, _labels(labels))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(DURATION_BUCKETS) + [0.0, 0]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def gauges(self):
+        pool = db.engine.pool
+        gauges = {}
+        for name, method in (('db_pool_size', 'size'), ('db_pool_checked_out', 'checkedout'),
+                             ('db_pool_overflow', 'overflow')):
+            if hasattr(pool, method):
+                gauges[(name, ())] = getattr(pool, method)()
+        return gauges
+
+    def _start_request(self):
+        _request_ctx_stack.top.metrics_start = time.perf_counter()
+
+    def _end_request(self, response):
+        start = getattr(_request_ctx_stack.top, 'metrics_start', None)
+        if start is None or request.endpoint in (None, 'metrics', 'static'):
+            return response
+        # Endpoint names as registered, without the blueprint: product_view, order_stats, ...
+        endpoint = request.endpoint.rsplit('.', 1)[-1]
+        self.inc('api_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        self.observe('api_request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+        stats = getattr(_request_ctx_stack.top, 'query_stats', None)
+        if stats is not None:
+            self.inc('api_request_queries_total', stats.count, endpoint=endpoint)
+        if self.directory and time.time() - self.last_flush > self.flush_interval:
+            self.flush()
+        return response
+
+    def snapshot(self):
+        with self.lock:
+            return {'pid': os.getpid(),
+                    'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                    'histograms': [[name, labels, list(values)] for (name, labels), values in self.histograms.items()],
+                    'gauges': [[name, labels, value] for (name, labels), value in self.gauges().items()]}
+
+    @contextmanager
+    def locked(self):
+        # Held while files are folded or read, so that a scrape never counts a worker twice or not at all.
+        with open(os.path.join(self.directory, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def write(self, file_name, data):
+        path = os.path.join(self.directory, file_name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def read(self):
+        snapshots = {}
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    snapshots[file_name] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def fold_dead(self):
+        # Sums dropping when a worker's file goes away, or is overwritten by a new worker with the same pid, read as
+        # a counter reset to Prometheus. Files of exited workers, and the one of our pid before we first wrote it,
+        # are added to the archive and removed instead. Runs locked.
+        snapshots = self.read()
+        archive = snapshots.pop(ARCHIVE, None)
+        dead = [file_name for file_name, snapshot in snapshots.items()
+                if not _alive(snapshot['pid']) or (snapshot['pid'] == os.getpid() and self.pid != os.getpid())]
+        if not dead:
+            return
+        counters, histograms, gauges = merge(([archive] if archive else []) + [snapshots[name] for name in dead])
+        self.write(ARCHIVE, {'pid': None, 'gauges': [],
+                             'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                             'histograms': [[name, labels, values] for (name, labels), values in histograms.items()]})
+        for file_name in dead:
+            os.remove(os.path.join(self.directory, file_name))
+
+    def flush(self):
+        self.last_flush = time.time()
+        if self.pid == os.getpid():
+            self.write('%d.json' % self.pid, self.snapshot())
+            return
+        # First write of this worker.
+        with self.locked():
+            self.fold_dead()
+            self.pid = os.getpid()
+            self.write('%d.json' % self.pid, self.snapshot())
+
+    def collect(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        with self.locked():
+            self.fold_dead()
+            return list(self.read().values())
+
+    def authorized(self):
+        config = current_app.config
+        token = config['METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer %s' % token):
+            return True
+        return request.remote_addr in config['METRICS_ALLOWED_IPS']
+
+    def expose(self):
+        # Not there at all unless a token or addresses are configured.
+        if not self.authorized():
+            abort(401 if current_app.config['METRICS_TOKEN'] else 404)
+        counters, histograms, gauges = merge(self.collect())
+
+        lines = []
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, labels in values}):
+                lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append('%s%s %s' % (name, _format_labels(labels), _number(value)))
+        for name in sorted({name for name, labels in histograms}):
+            lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+            lines.append('# TYPE %s histogram' % name)
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                # observe() already counts every bucket a value fits in, so the buckets are cumulative.
+                for bound, count in zip(DURATION_BUCKETS, values):
+                    lines.append('%s_bucket%s %d' % (name, _format_labels(labels, [('le', bound)]), count))
+                lines.append('%s_bucket%s %d' % (name, _format_labels(labels, [('le', '+Inf')]), values[-1]))
+                lines.append('%s_sum%s %s' % (name, _format_labels(labels), _number(values[-2])))
+                lines.append('%s_count%s %d' % (name, _format_labels(labels), values[-1]))
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def merge(snapshots):
+    counters, histograms, gauges = defaultdict(float), {}, defaultdict(float)
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            histograms[key] = [a + b for a, b in zip(histograms.get(key, [0] * len(values)), values)]
+        if snapshot['gauges'] and _alive(snapshot['pid']):
+            for name, labels, value in snapshot['gauges']:
+                gauges[(name, tuple(map(tuple, labels)))] += value
+    return counters, histograms, gauges
+
+
+def _number(value):
+    return '%d' % value if float(value).is_integer() else repr(float(value))
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+metrics = Metrics()
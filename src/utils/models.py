@@ -2,7 +2,7 @@ import re
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import text
+from sqlalchemy import text, inspect
 
 db = SQLAlchemy()
 
@@ -23,10 +23,26 @@ class BaseMixin(object):
 
     id = db.Column(UUID(as_uuid=False), index=True, primary_key=True, server_default=text("uuid_generate_v4()"))
     created_on = db.Column(db.TIMESTAMP, server_default=text("current_timestamp"))
-    updated_on = db.Column(db.TIMESTAMP, onupdate=db.func.current_timestamp(),
+    updated_on = db.Column(db.TIMESTAMP, onupdate=db.func.current_timestamp(), index=True,
                            server_default=text("current_timestamp"))
 
 
+def create_missing_indexes():
+    # create_all() leaves existing tables alone, indexes declared on them later (such as updated_on) are added here.
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+
 class ReprMixin(object):
     """Provides a string representible form for objects."""
 
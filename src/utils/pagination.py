@@ -0,0 +1,112 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import namedtuple
+from datetime import datetime, date
+
+from flask import abort
+from sqlalchemy import and_, or_, false
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Executable, ClauseElement
+
+from .exceptions import CustomException
+from .models import db
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+DATE_FORMAT = '%Y-%m-%d'
+
+TOTAL_MODES = ('exact', 'estimate', 'none')
+
+Page = namedtuple('Page', ['items', 'total'])
+
+
+class Explain(Executable, ClauseElement):
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _explain(element, compiler, **kwargs):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kwargs)
+
+
+def estimate_count(queryset):
+    if db.engine.dialect.name != 'postgresql':
+        return queryset.order_by(None).count()
+    plan = db.session.execute(Explain(queryset.enable_eagerloads(False).order_by(None).statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_rows(queryset, mode):
+    if mode == 'none':
+        return None
+    if mode == 'estimate':
+        return estimate_count(queryset)
+    return queryset.order_by(None).count()
+
+
+def paginate(queryset, page, per_page, total='exact'):
+    if page < 1:
+        abort(404)
+    items = queryset.limit(per_page).offset((page - 1) * per_page).all()
+    if total != 'none' and page == 1 and len(items) < per_page:
+        return Page(items, len(items))
+    return Page(items, count_rows(queryset, total))
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.strftime(DATETIME_FORMAT)}
+    if isinstance(value, date):
+        return {'d': value.strftime(DATE_FORMAT)}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.strptime(value['dt'], DATETIME_FORMAT)
+        return datetime.strptime(value['d'], DATE_FORMAT).date()
+    return value
+
+
+def encode_cursor(keys, values):
+    payload = json.dumps({'k': keys, 'v': [_dump_value(value) for value in values]}, separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def invalid_cursor(token):
+    return CustomException(data={'__cursor': token}, message='Invalid cursor', operation='paginating resource',
+                           status=400)
+
+
+def decode_cursor(token, keys):
+    try:
+        payload = json.loads(urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        if payload['k'] != keys or len(payload['v']) != len(keys):
+            raise ValueError(token)
+        return [_load_value(value) for value in payload['v']]
+    except (ValueError, TypeError, KeyError):
+        raise invalid_cursor(token)
+
+
+def keyset_filter(columns, values):
+    # Rows strictly after ``values`` for ``ORDER BY columns``, following Postgres' default NULL placement
+    # (NULLS LAST for ascending keys, NULLS FIRST for descending ones).
+    (column, desc), value = columns[0], values[0]
+    rest = keyset_filter(columns[1:], values[1:]) if len(columns) > 1 else None
+
+    clauses = []
+    if value is None:
+        if desc:
+            clauses.append(column.isnot(None))
+        tie = column.is_(None)
+    else:
+        clauses.append(column < value if desc else or_(column > value, column.is_(None)))
+        tie = column == value
+
+    if rest is not None:
+        clauses.append(and_(tie, rest))
+    return or_(*clauses) if clauses else false()
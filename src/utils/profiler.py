@@ -0,0 +1,94 @@
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from io import StringIO
+
+from flask import request, current_app
+
+from .instrumentation import query_stats, fingerprint
+
+SQL_FRAMES = ('do_execute', 'do_executemany', 'do_execute_no_params')
+
+
+class Sampler(threading.Thread):
+    # Samples the stack of the request thread every ``interval`` seconds. cProfile only keeps caller/callee
+    # pairs, full stacks are what flame graphs need.
+
+    def __init__(self, thread_id, root, code, interval):
+        super(Sampler, self).__init__(daemon=True)
+        self.thread_id = thread_id
+        self.root = root
+        self.code = code
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame, self.root, self.code)] += 1
+
+
+def frame_name(frame):
+    return '%s:%s' % (frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+
+
+def collapse(frame, root=None, code=None):
+    # Stacks that do not start in ``code`` were sampled before or after the profiled call and are dropped.
+    stack = []
+    if frame.f_code.co_name in SQL_FRAMES and isinstance(frame.f_locals.get('statement'), str):
+        # Time spent waiting on the database shows up as a leaf per statement shape.
+        stack.append('SQL %s' % fingerprint(frame.f_locals['statement'])[:120])
+    outermost = None
+    while frame is not None and frame is not root:
+        stack.append(frame_name(frame))
+        outermost, frame = frame, frame.f_back
+    if code is not None and (outermost is None or outermost.f_code is not code):
+        return ''
+    return ';'.join(name.replace(';', ',') for name in reversed(stack))
+
+
+def profile_collapsed(func, *args, **kwargs):
+    sampler = Sampler(threading.get_ident(), sys._getframe(), getattr(func, '__code__', None),
+                      current_app.config['PROFILE_SAMPLE_INTERVAL'])
+    sampler.start()
+    try:
+        response = func(*args, **kwargs)
+    finally:
+        sampler.done.set()
+        sampler.join()
+    body = '\n'.join('%s %d' % (stack, count) for stack, count in sorted(sampler.stacks.items()) if stack)
+    return response, body + '\n'
+
+
+def profile_stats(func, *args, **kwargs):
+    stats = query_stats()
+    if stats is not None:
+        stats.trace = True
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    response = profiler.runcall(func, *args, **kwargs)
+    duration = time.perf_counter() - started
+
+    out = StringIO()
+    out.write('%s %s\n' % (request.method, request.full_path))
+    out.write('status %d, %d bytes, %.2f ms' % (response.status_code, len(response.get_data()), duration * 1000))
+    queries = [query for query in stats.queries if query[1] >= started] if stats is not None else []
+    out.write(', %d queries in %.2f ms\n\n' % (len(queries), sum(query[2] for query in queries) * 1000))
+
+    out.write('SQL (offset ms, duration ms, origin, statement)\n')
+    for statement, offset, query_duration, origin in queries:
+        out.write('%9.2f %9.2f  %s\n    %s\n' % ((offset - started) * 1000, query_duration * 1000, origin or '-',
+                                                ' '.join(statement.split())))
+
+    out.write('\nPython (sorted by %s)\n' % current_app.config['PROFILE_SORT'])
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(current_app.config['PROFILE_SORT']) \
+        .print_stats(current_app.config['PROFILE_LIMIT'])
+    return response, out.getvalue()
+
+
+PROFILERS = {'1': profile_stats, 'stats': profile_stats, 'collapsed': profile_collapsed}
@@ -1,11 +1,24 @@
+import hashlib
+from collections import defaultdict
 from abc import ABC, abstractmethod
+from datetime import date
 from typing import Type, List, Tuple
 
-from flask import request
-from sqlalchemy.exc import OperationalError, IntegrityError
+from flask import request, abort
+from flask_security import current_user
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError, IntegrityError, DataError
+from sqlalchemy.orm import load_only
 
 from .exceptions import ResourceNotFound, SQLIntegrityError, SQlOperationalError, CustomException, RequestNotAllowed
 from .models import db
+from .schema import get_schema
+from .serializers import fast_dump
+from .cache import response_cache, mark_changed
+from .bulk import bulk_insert, bind_uuids, insert_relations, delete_relations
+from .pagination import encode_cursor, decode_cursor, invalid_cursor, keyset_filter, TOTAL_MODES
+from .loading import plan_loads, joined_options, load_collections, resolve_batch_fields, projection, \
+    planned_paths, resolve_path, path_tables, path_aggregates
 
 
 class ModelResource(ABC):
@@ -32,18 +45,49 @@ class ModelResource(ABC):
 
     page: int = 1
 
+    total: str = 'exact'
+
     auth_required: bool = False
 
     export: bool = False
 
     max_export_limit: int = 5000
 
+    export_chunk_size: int = 500
+
+    export_unlimited_roles: Tuple[str] = ()
+
+    eager_load: bool = True
+
+    eager_load_depth: int = 3
+
+    project_columns: bool = True
+
+    fast_serializer: bool = False
+
+    etag: bool = False
+
+    etag_related: Tuple = ()
+
+    cache: bool = False
+
+    cache_timeout: int = None
+
+    bulk_insert: bool = False
+
+    bulk_batch_size: int = 1000
+
+    batch_update: bool = False
+
     roles_accepted: Tuple[str] = ()
 
     roles_required: Tuple[str] = ()
 
     def __init__(self):
 
+        self.load_plan = []
+        self.dump_fields = []
+
         if request.args.getlist('__only'):
             if len(request.args.getlist('__only')) == 1:
                 self.obj_only = tuple(request.args.getlist('__only')[0].split(','))
@@ -80,6 +124,12 @@ class ModelResource(ABC):
         self.limit = int(request.args.get('__limit')) if request.args.get('__limit') \
                                                          and int(
             request.args.get('__limit')) <= self.max_limit else self.default_limit
+        self.cursor = request.args.get('__cursor')
+
+        if request.args.get('__total') in TOTAL_MODES:
+            self.total = request.args['__total']
+        elif self.cursor is not None:
+            self.total = 'none'
 
     def apply_filters(self, queryset, **kwargs):
         for k, v in kwargs.items():
@@ -105,10 +155,110 @@ class ModelResource(ABC):
                 queryset = queryset.order_by(getattr(self.model, order_by))
         return queryset
 
+    def apply_loading(self, queryset, schema):
+        self.dump_fields = [name for name, field in schema.fields.items() if not field.load_only]
+        if self.eager_load:
+            self.load_plan = plan_loads(self.model, schema, self.eager_load_depth)
+        columns = projection(self.model, schema) if self.project_columns else None
+        if columns is not None:
+            queryset = queryset.options(load_only(*columns))
+        return queryset.options(*joined_options(self.load_plan))
+
+    def load_related(self, objects):
+        load_collections(objects, self.load_plan)
+        return resolve_batch_fields(self.model, objects, self.dump_fields)
+
+    def dump(self, schema, objects, many=True):
+        if self.fast_serializer:
+            return fast_dump(schema, objects, many=many)
+        return schema.dump(objects, many=many).data
+
+    def get_etag(self, queryset, schema):
+        # Weak validator from max(updated_on) and row count of the filtered rows and of the rows they reach through
+        # every relationship path the payload reads (dumped relationships and ``etag_related`` paths behind
+        # hybrids), all in one query.
+        if not self.etag:
+            return None
+        rows = queryset.order_by(None).with_entities(self.model.id, self.model.updated_on).cte('etag_rows')
+        columns = [select([func.max(rows.c.updated_on)]).as_scalar(),
+                   select([func.count()]).select_from(rows).as_scalar()]
+        for path in self.dependent_paths(schema):
+            columns.extend(path_aggregates(self.model, path, select([rows.c.id])))
+
+        # Stock expiry and similar hybrids depend on the date, and the rows a user sees depend on the user.
+        scope = [request.full_path, str(current_user.get_id()), date.today().isoformat()]
+        scope.extend(str(value) for value in db.session.query(*columns).one())
+        return hashlib.md5('|'.join(scope).encode('utf-8')).hexdigest()
+
+    def dependent_paths(self, schema):
+        paths = planned_paths(plan_loads(self.model, schema, self.eager_load_depth))
+        for path in self.etag_related:
+            paths.extend(props for props in resolve_path(self.model, path) if props not in paths)
+        return paths
+
+    def dependent_tables(self, schema):
+        return path_tables(self.dependent_paths(schema))
+
+    def cache_scope(self):
+        # Responses are shared between users that see the same shops with the same roles and permissions.
+        if not current_user.is_authenticated:
+            return []
+        authorization = current_user.authorization
+        return [sorted(authorization.retail_shop_ids), sorted(authorization.roles),
+                sorted(authorization.permissions)]
+
+    def cache_key(self, schema):
+        if not self.cache or not response_cache.enabled:
+            return None
+        # Versioned by the same tables as the ETag, a commit touching any of them moves every key on.
+        tables = sorted(self.dependent_tables(schema) | {self.model.__table__}, key=lambda t: t.name)
+        args = sorted((key, value) for key, values in request.args.lists() for value in values)
+        scope = [type(self).__name__, request.path, repr(args), repr(self.cache_scope()),
+                 repr(response_cache.versions(tables)), date.today().isoformat()]
+        return hashlib.md5('|'.join(scope).encode('utf-8')).hexdigest()
+
+    def cursor_keys(self, order_by=None):
+        keys = []
+        if order_by:
+            desc = order_by.startswith('-')
+            order_by = order_by.replace('-', '')
+            if order_by in self.order_by and order_by != 'id':
+                keys.append([order_by, desc])
+        keys.append(['id', keys[0][1] if keys else False])
+        return keys
+
+    def apply_cursor(self, queryset, order_by=None):
+        keys = self.cursor_keys(order_by)
+        columns = [(getattr(self.model, name), desc) for name, desc in keys]
+        if self.cursor:
+            queryset = queryset.filter(keyset_filter(columns, decode_cursor(self.cursor, keys)))
+        queryset = queryset.order_by(*[column.desc() if desc else column for column, desc in columns])
+
+        try:
+            items = queryset.limit(self.limit + 1).all()
+        except DataError:
+            if not self.cursor:
+                raise
+            # Well formed but edited, e.g. an id that is not a uuid.
+            db.session.rollback()
+            raise invalid_cursor(self.cursor)
+        next_cursor = None
+        if len(items) > self.limit:
+            items = items[:self.limit]
+            next_cursor = encode_cursor(keys, [getattr(items[-1], name) for name, desc in keys])
+        return items, next_cursor
+
+    def export_queryset(self, queryset):
+        if any(current_user.has_role(role) for role in self.export_unlimited_roles):
+            return queryset
+        if self.page < 1:
+            abort(404)
+        return queryset.limit(self.max_export_limit).offset((self.page - 1) * self.max_export_limit)
+
     def patch_resource(self, obj):
         if self.has_change_permission(obj) and obj:
-            obj, errors = self.schema(exclude=self.exclude_related_resource).load(request.json, instance=obj,
-                                                                                  partial=True)
+            obj, errors = get_schema(self.schema, exclude=self.exclude_related_resource)\
+                .load(request.json, instance=obj, partial=True)
             if errors:
                 db.session.rollback()
                 return {'error': True, 'message': str(errors)}, 400
@@ -124,17 +274,19 @@ class ModelResource(ABC):
                 raise SQlOperationalError(data={}, message='Operational Error', operation='Adding Resource',
                                           status=400)
             return {'success': True, 'message': 'obj updated successfully',
-                    'data': self.schema(exclude=tuple(self.obj_exclude), only=tuple(self.obj_only))
+                    'data': get_schema(self.schema, self.obj_only, self.obj_exclude)
                         .dump(obj).data}, 200
 
         return {'error': True, 'message': 'Forbidden Permission Denied To Change Resource'}, 403
 
     def update_resource(self):
         data = request.json if isinstance(request.json, list) else [request.json]
+        if self.batch_update and '__batch' in request.args:
+            return self.batch_update_resource(data, '__atomic' in request.args)
         objects = []
         for d in data:
-            obj = self.schema().get_instance(d)
-            obj, errors = self.schema().load(d, instance=obj)
+            obj = get_schema(self.schema).get_instance(d)
+            obj, errors = get_schema(self.schema).load(d, instance=obj)
             if errors:
                 db.session.rollback()
                 return {'error': True, 'message': str(errors)}, 400
@@ -153,12 +305,91 @@ class ModelResource(ABC):
                 raise SQlOperationalError(data=d, message='Operational Error', operation='Updating Resource',
                                           status=400)
         return {'success': True, 'message': 'Resource Updated successfully',
-                'data': self.schema(exclude=tuple(self.obj_exclude), only=tuple(self.obj_only))
+                'data': get_schema(self.schema, self.obj_only, self.obj_exclude)
                     .dump(objects, many=True).data}, 201
 
+    def apply_batch_changes(self, data, indices):
+        # Loads the payload onto the rows without flushing, so that nothing reaches the database before the check
+        # of the changed rows has passed.
+        errors = {}
+        with db.session.no_autoflush:
+            ids = list({data[index].get('id') for index in indices
+                        if isinstance(data[index], dict) and data[index].get('id')})
+            instances = {}
+            for start in range(0, len(ids), self.bulk_batch_size):
+                chunk = ids[start:start + self.bulk_batch_size]
+                instances.update((obj.id, obj) for obj in self.model.query.filter(self.model.id.in_(chunk)))
+
+            targets = [(index, instances.get(data[index].get('id') if isinstance(data[index], dict) else None))
+                       for index in indices]
+            for index, obj in targets:
+                if obj is None:
+                    errors[index] = 'Resource not found'
+            targets = [(index, obj) for index, obj in targets if obj is not None]
+            # Checked before the changes (the row as stored) and after them (the row as it would be saved).
+            permissions = self.has_batch_change_permission([obj for index, obj in targets])
+            for (index, obj), allowed in zip(targets, permissions):
+                if not allowed:
+                    errors[index] = 'Forbidden Permission Denied To Change Resource'
+
+            schema = get_schema(self.schema)
+            objects = []
+            for index, obj in targets:
+                if index in errors:
+                    continue
+                obj, error = schema.load(data[index], instance=obj)
+                if error:
+                    errors[index] = error
+                    continue
+                bind_uuids(obj)
+                objects.append((index, obj))
+            permissions = self.has_batch_change_permission([obj for index, obj in objects])
+            for (index, obj), allowed in zip(objects, permissions):
+                if not allowed:
+                    errors[index] = 'Forbidden Permission Denied To Change Resource'
+        return objects, errors
+
+    def batch_update_resource(self, data, atomic=False):
+        # One IN query for the targets and one flush for the changes; rows that fail are reported by their index
+        # and left out, or roll the whole request back when atomic.
+        errors = {}
+        indices = list(range(len(data)))
+        while True:
+            objects, failed = self.apply_batch_changes(data, indices)
+            errors.update(failed)
+            if atomic or not any(index in failed for index, obj in objects):
+                break
+            # A rejected change is already on its row and on whatever it touched through relationships, only a
+            # rollback reliably drops it. The accepted rows are applied again.
+            db.session.rollback()
+            indices = [index for index, obj in objects if index not in failed]
+        ids = [obj.id for index, obj in objects]
+
+        if errors and (atomic or not ids):
+            db.session.rollback()
+            return {'error': True, 'message': 'Resources not updated', 'errors': errors}, 400
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise SQLIntegrityError(data={}, message='Integrity Error', operation='Updating Resource', status=400)
+        except OperationalError:
+            db.session.rollback()
+            raise SQlOperationalError(data={}, message='Operational Error', operation='Updating Resource',
+                                      status=400)
+        # Commit expired the rows, they are read back in one query instead of one refresh each.
+        schema = get_schema(self.schema, self.obj_only, self.obj_exclude)
+        objects = self.apply_loading(self.model.query.filter(self.model.id.in_(ids)), schema).all()
+        order = {obj_id: position for position, obj_id in enumerate(ids)}
+        objects.sort(key=lambda obj: order[obj.id])
+        return {'success': True, 'message': 'Resource Updated successfully', 'errors': errors,
+                'data': self.dump(schema, self.load_related(objects))}, 201
+
     def save_resource(self):
         data = request.json if isinstance(request.json, list) else [request.json]
-        objects, errors = self.schema().load(data, session=db.session, many=True)
+        if self.bulk_insert and '__bulk' in request.args:
+            return self.bulk_save_resource(data)
+        objects, errors = get_schema(self.schema).load(data, session=db.session, many=True)
         if errors:
             db.session.rollback()
             return {'error': True, 'message': str(errors)}, 400
@@ -178,9 +409,35 @@ class ModelResource(ABC):
             db.session.rollback()
             raise SQlOperationalError(data=data, message='Operational Error', operation='Adding Resource', status=400)
         return {'success': True, 'message': 'Resource added successfully',
-                'data': self.schema(exclude=tuple(self.obj_exclude), only=tuple(self.obj_only))
+                'data': get_schema(self.schema, self.obj_only, self.obj_exclude)
                     .dump(objects, many=True).data}, 201
 
+    def bulk_save_resource(self, data):
+        schema = get_schema(self.schema)
+        objects = []
+        for start in range(0, len(data), self.bulk_batch_size):
+            batch, errors = schema.load(data[start:start + self.bulk_batch_size], session=db.session, many=True)
+            if errors:
+                db.session.rollback()
+                errors = {start + index if isinstance(index, int) else index: error for index, error in errors.items()}
+                return {'error': True, 'message': str(errors)}, 400
+            objects.extend(batch)
+
+        if not self.has_add_permission(objects):
+            db.session.rollback()
+            return {'error': True, 'message': 'Forbidden Permission Denied To Add Resource'}, 403
+        try:
+            ids = bulk_insert(self.model, objects, self.bulk_batch_size)
+            mark_changed(self.model)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise SQLIntegrityError(data={}, message='Integrity Error', operation='Adding Resource', status=400)
+        except OperationalError:
+            db.session.rollback()
+            raise SQlOperationalError(data={}, message='Operational Error', operation='Adding Resource', status=400)
+        return {'success': True, 'message': 'Resources added successfully', 'data': ids}, 201
+
     @abstractmethod
     def has_read_permission(self, qs) -> Type(db.Model):
         return qs
@@ -197,6 +454,9 @@ class ModelResource(ABC):
     def has_add_permission(self, obj) -> bool:
         return True
 
+    def has_batch_change_permission(self, objects) -> List[bool]:
+        return [bool(self.has_change_permission(obj)) for obj in objects]
+
 
 class AssociationModelResource(ABC):
     model = None
@@ -223,8 +483,16 @@ class AssociationModelResource(ABC):
 
     page: int = 1
 
+    total: str = 'exact'
+
     auth_required = False
 
+    bulk_relations: bool = False
+
+    relation_keys: Tuple[str] = ()
+
+    bulk_batch_size: int = 1000
+
     roles_accepted: Tuple[str] = ()
 
     roles_required: Tuple[str] = ()
@@ -268,6 +536,9 @@ class AssociationModelResource(ABC):
                                                          and int(
             request.args.get('__limit')) <= self.max_limit else self.default_limit
 
+        if request.args.get('__total') in TOTAL_MODES:
+            self.total = request.args['__total']
+
     def apply_filters(self, queryset, **kwargs):
         for k, v in kwargs.items():
             array_key = k.split('__')
@@ -292,7 +563,7 @@ class AssociationModelResource(ABC):
         return queryset
 
     def add_relation(self, data):
-        obj, errors = self.schema().load(data, session=db.session)
+        obj, errors = get_schema(self.schema).load(data, session=db.session)
         if errors:
             raise CustomException(data=data, message=str(errors), operation='adding relation')
 
@@ -308,28 +579,80 @@ class AssociationModelResource(ABC):
             raise RequestNotAllowed(data=data, message='Object not Found', operation='adding relation',
                                     status=401)
 
+    def load_relation_update(self, data):
+        # Validates and flushes one update without committing it. The row has to be changeable both as it was and
+        # as it is after the update, so that it cannot be moved onto a product of another shop.
+        obj = self.model.query.get(data['id']) if data.get('id') else None
+        if obj is None:
+            raise ResourceNotFound(data=data, message='Object not Found', operation='updating relation', status=404)
+        if not self.has_change_permission(obj, data):
+            raise RequestNotAllowed(data=data, message='Permission Denied', operation='updating relation',
+                                    status=401)
+        obj, errors = get_schema(self.schema).load({key: value for key, value in data.items()
+                                                    if key not in ('id', '__action')}, instance=obj)
+        if errors:
+            raise CustomException(data=data, message=str(errors), operation='updating relation')
+        bind_uuids(obj)
+        try:
+            db.session.flush()
+        except IntegrityError as e:
+            raise SQLIntegrityError(data=data, message=str(e), operation='updating relation', status=400)
+        except OperationalError as e:
+            raise SQlOperationalError(data=data, message=str(e), operation='updating relation', status=400)
+        db.session.expire(obj)
+        if not self.has_change_permission(obj, data):
+            raise RequestNotAllowed(data=data, message='Permission Denied', operation='updating relation',
+                                    status=401)
+        return obj
+
     def update_relation(self, data):
-        obj = self.model.query.get(data['id'])
-        if obj:
-            obj, errors = self.schema().load(data, instance=obj)
+        self.load_relation_update(data)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise SQLIntegrityError(data=data, message='Integrity Error', operation='updating relation', status=400)
+        except OperationalError:
+            db.session.rollback()
+            raise SQlOperationalError(data=data, message='Operational Error', operation='updating relation',
+                                      status=400)
+
+    def apply_relations(self, data):
+        # Adds and removes are grouped by action and run as one statement per batch; permissions are checked by
+        # has_bulk_permission on every action's rows as a whole. Updates go row by row through the ORM first. All of
+        # it is committed once at the end, an error anywhere leaves nothing applied.
+        actions = defaultdict(list)
+        for d in data:
+            actions[d.get('__action')].append(d)
+        for d in actions.pop('update', []):
+            self.load_relation_update(d)
+
+        schema = get_schema(self.schema)
+        for action, apply in (('add', insert_relations), ('remove', delete_relations)):
+            rows = actions.get(action)
+            if not rows:
+                continue
+            rows = [{key: value for key, value in d.items() if key != '__action'} for d in rows]
+            errors = schema.validate(rows, many=True)
+            if not errors and any(d.get(key) is None for d in rows for key in self.relation_keys):
+                errors = '%s are required' % ', '.join(self.relation_keys)
             if errors:
-                raise CustomException(data=data, message=str(errors), operation='updating relation')
-            if self.has_change_permission(obj, data):
-                raise CustomException(data=data, message='Permission Denied', operation='adding relation')
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
-                raise SQLIntegrityError(data=data, message='Integrity Error', operation='Adding Resource', status=400)
-            except OperationalError:
-                db.session.rollback()
-                raise SQlOperationalError(data=data, message='Operational Error', operation='Adding Resource',
-                                          status=400)
-            else:
-                raise RequestNotAllowed(data=data, message='Object not Found', operation='deleting relation',
+                raise CustomException(data={}, message=str(errors), operation='%s relations' % action)
+            if not self.has_bulk_permission(action, rows):
+                raise RequestNotAllowed(data={}, message='Object not Found', operation='%s relations' % action,
                                         status=401)
-        else:
-            raise ResourceNotFound(data=data, message='Object not Found', operation='Updating relation', status=404)
+            apply(self.model, self.relation_keys, {tuple(str(d[key]) for key in self.relation_keys) for d in rows},
+                  self.bulk_batch_size)
+
+        mark_changed(self.model)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise SQLIntegrityError(data={}, message=str(e), operation='updating relations', status=400)
+        except OperationalError as e:
+            db.session.rollback()
+            raise SQlOperationalError(data={}, message=str(e), operation='updating relations', status=400)
 
     def remove_relation(self, data):
         obj = self.model.query
@@ -369,3 +692,6 @@ class AssociationModelResource(ABC):
     @abstractmethod
     def has_add_permission(self, obj, data) -> bool:
         return True
+
+    def has_bulk_permission(self, action, rows) -> bool:
+        return False
@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 from flask_marshmallow import Marshmallow
 from marshmallow_sqlalchemy import ModelSchema, ModelSchemaOpts
 from .models import db
@@ -21,3 +24,36 @@ class BaseOpts(ModelSchemaOpts):
 
 class BaseSchema(ModelSchema):
     OPTIONS_CLASS = BaseOpts
+
+    def get_attribute(self, attr, obj, default):
+        batch_values = getattr(obj, '_batch_values', None)
+        if batch_values and attr in batch_values:
+            return batch_values[attr]
+        return super(BaseSchema, self).get_attribute(attr, obj, default)
+
+
+SCHEMA_CACHE_SIZE = 256
+
+_schemas = threading.local()
+
+
+def get_schema(schema, only=(), exclude=()):
+    # Schema instances carry per call state (marshaller errors, the instance being loaded) so they are cached
+    # per thread instead of being shared behind a lock.
+    cache = getattr(_schemas, 'cache', None)
+    if cache is None:
+        cache = _schemas.cache = OrderedDict()
+
+    key = (schema, frozenset(only or ()), frozenset(exclude or ()))
+    instance = cache.get(key)
+    if instance is None:
+        instance = cache[key] = schema(only=tuple(only or ()), exclude=tuple(exclude or ()))
+        if len(cache) > SCHEMA_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+        instance.instance = None
+        instance._marshal.reset_errors()
+        instance._unmarshal.reset_errors()
+        instance._marshal._pending = instance._unmarshal._pending = False
+    return instance
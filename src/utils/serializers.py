@@ -0,0 +1,108 @@
+from collections.abc import Mapping
+
+from marshmallow import fields, missing, ValidationError
+
+from .schema import BaseSchema
+
+DUMP_PROCESSORS = ('pre_dump', 'post_dump')
+
+CONVERTERS = {
+    fields.String: 'value if value.__class__ is str else {field}._serialize(value, {name!r}, obj)',
+    fields.UUID: 'value if value.__class__ is str else {field}._serialize(value, {name!r}, obj)',
+    fields.Integer: 'value if value.__class__ is int else int(value)',
+    fields.Float: 'float(value)',
+    fields.Boolean: 'value if value.__class__ is bool else {field}._serialize(value, {name!r}, obj)',
+    fields.Date: 'value.isoformat()',
+}
+
+
+def compilable(schema):
+    if schema.prefix or schema.extra:
+        return False
+    if any(tag in DUMP_PROCESSORS and names for (tag, pass_many), names in schema.__processors__.items()):
+        return False
+    # Fields named in ``only`` without a declaration get their type inferred from the dumped object.
+    return all(name in schema.declared_fields for name in schema.only or ())
+
+
+def get_dumper(schema):
+    dumper = getattr(schema, '_fast_dump', None)
+    if dumper is None:
+        dumper = schema._fast_dump = compile_schema(schema)
+    return dumper
+
+
+def _nested_dumper(field):
+    # Compiled on first use, so that recursive schemas only go as deep as the data does.
+    dumpers = []
+
+    def dump(value):
+        if not dumpers:
+            dumpers.append(get_dumper(field.schema))
+        if field.many:
+            return [dumpers[0](item) for item in value]
+        return dumpers[0](value)
+    return dump
+
+
+def compile_schema(schema):
+    # Builds ``dump(obj)`` for a single object with the schema's fields unrolled, reading values through
+    # schema.get_attribute like marshmallow does. Field types without a fast path call field.serialize.
+    namespace = {'missing': missing, 'dict_class': schema.dict_class, 'get': schema.get_attribute,
+                 'Mapping': Mapping, 'dump_schema': schema.dump}
+    lines = ['def dump(obj):', '    out = dict_class()']
+
+    # BaseSchema.get_attribute is inlined for mapped objects, marshmallow tries ``obj[attr]`` first for every field.
+    inline = type(schema).get_attribute is BaseSchema.get_attribute
+    if inline:
+        lines.append('    if isinstance(obj, Mapping):')
+        lines.append('        return dump_schema(obj, many=False).data')
+        lines.append('    batch_values = getattr(obj, "_batch_values", None) or {}')
+
+    for index, (name, field) in enumerate(schema.fields.items()):
+        if field.load_only:
+            continue
+        field_var = 'field_%d' % index
+        namespace[field_var] = field
+
+        converter = CONVERTERS.get(type(field))
+        if getattr(field, 'as_string', False):
+            converter = None
+        if type(field) is fields.Nested and not isinstance(field.only, str) and compilable(field.schema):
+            namespace['nested_%d' % index] = _nested_dumper(field)
+            converter = 'nested_%d(value)' % index
+
+        if converter is None:
+            lines.append('    value = %s.serialize(%r, obj, accessor=get)' % (field_var, name))
+        else:
+            attribute = field.attribute or name
+            if inline and '.' not in attribute:
+                lines.append('    value = batch_values[%r] if %r in batch_values else getattr(obj, %r, missing)'
+                             % (attribute, attribute, attribute))
+            else:
+                lines.append('    value = get(%r, obj, missing)' % attribute)
+            lines.append('    if value is missing:')
+            lines.append('        value = %s.default() if callable(%s.default) else %s.default'
+                         % (field_var, field_var, field_var))
+            lines.append('    elif value is not None:')
+            lines.append('        value = ' + converter.format(field=field_var, name=name))
+        lines.append('    if value is not missing:')
+        lines.append('        out[%r] = value' % name)
+
+    lines.append('    return out')
+    exec('\n'.join(lines), namespace)
+    return namespace['dump']
+
+
+def fast_dump(schema, obj, many=False):
+    # Same result as ``schema.dump(obj, many=many).data``; anything the compiled function can not format
+    # is handed back to marshmallow so that errors are reported the way they always were.
+    if not compilable(schema):
+        return schema.dump(obj, many=many).data
+    dumper = get_dumper(schema)
+    try:
+        if many:
+            return [dumper(item) for item in obj]
+        return dumper(obj)
+    except (ValidationError, TypeError, ValueError, AttributeError):
+        return schema.dump(obj, many=many).data
@@ -1,6 +1,21 @@
 import unittest
 from .test_users import TestSetup\
     , TestSetupFailure, TestRole, TestUser, TestUserRole
+from .test_query_budgets import TestQueryBudgets
+from .test_pagination import TestKeysetPagination, TestTotals
+from .test_serializers import TestFastDump
+from .test_loading import TestBatchFields
+from .test_ledger import TestStockLedger
+from .test_metrics import TestMetricsAccess
+from .test_encoding import TestResponseEncoding
+from .test_relations import TestBulkRelations
+from .test_bulk import TestBulkInsert
+from .test_batch_update import TestBatchUpdate
+from .test_tokens import TestTokenRevocation
+from .test_response_cache import TestResponseCache
+from .test_export import TestExportLimit
+from .test_etag import TestETag
+from .test_sync import TestCatalogSync
 
 
 def suite():
@@ -10,4 +25,20 @@ def suite():
     test_suite.addTest(unittest.makeSuite(TestUser))
     test_suite.addTest(unittest.makeSuite(TestRole))
     test_suite.addTest(unittest.makeSuite(TestUserRole))
+    test_suite.addTest(unittest.makeSuite(TestQueryBudgets))
+    test_suite.addTest(unittest.makeSuite(TestKeysetPagination))
+    test_suite.addTest(unittest.makeSuite(TestTotals))
+    test_suite.addTest(unittest.makeSuite(TestFastDump))
+    test_suite.addTest(unittest.makeSuite(TestBatchFields))
+    test_suite.addTest(unittest.makeSuite(TestStockLedger))
+    test_suite.addTest(unittest.makeSuite(TestMetricsAccess))
+    test_suite.addTest(unittest.makeSuite(TestResponseEncoding))
+    test_suite.addTest(unittest.makeSuite(TestBulkRelations))
+    test_suite.addTest(unittest.makeSuite(TestBulkInsert))
+    test_suite.addTest(unittest.makeSuite(TestBatchUpdate))
+    test_suite.addTest(unittest.makeSuite(TestTokenRevocation))
+    test_suite.addTest(unittest.makeSuite(TestResponseCache))
+    test_suite.addTest(unittest.makeSuite(TestExportLimit))
+    test_suite.addTest(unittest.makeSuite(TestETag))
+    test_suite.addTest(unittest.makeSuite(TestCatalogSync))
     return test_suite
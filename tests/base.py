@@ -0,0 +1,41 @@
+import json
+
+from flask_testing import TestCase
+
+from manager import app, db
+from src import configs
+from src.benchmark import seed_dataset
+from src.products.barcodes import barcode_index
+from src.utils.cache import response_cache
+
+
+class SeededTestCase(TestCase):
+    # Two brands with two shops each, seeded by src.benchmark and logged in as the user of the first one. Tables
+    # are emptied afterwards instead of dropped, drop_all trips over the enums named varchar.
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        app.config.from_object(configs.get('testing'))
+        db.create_all()
+        self.emails, _ = seed_dataset(brands=2, shops=2, products=20, days=14, orders=3, customers=5)
+        self.headers = self.login(self.emails[0])
+
+    def tearDown(self):
+        db.session.remove()
+        db.session.execute('TRUNCATE %s CASCADE' % ', '.join('"%s"' % table.name
+                                                             for table in db.metadata.sorted_tables))
+        db.session.commit()
+        db.session.remove()
+        if response_cache.enabled:
+            response_cache.backend.clear()
+        barcode_index.shops.clear()
+
+    def login(self, email, password='password'):
+        response = self.client.post('/api/v1/login/', data=json.dumps({'email': email, 'password': password}),
+                                    content_type='application/json')
+        self.assert200(response)
+        # Only the token authenticates, as for the apps.
+        self.client.cookie_jar.clear()
+        return {'Authorization': response.json['authentication_token'], 'Content-Type': 'application/json'}
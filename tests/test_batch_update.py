@@ -0,0 +1,65 @@
+import json
+from uuid import uuid4
+
+from manager import db
+from src.products.models import Product, Stock
+from src.user.models import User, Permission, UserPermission
+from .base import SeededTestCase
+
+
+class TestBatchUpdate(SeededTestCase):
+
+    def setUp(self):
+        super(TestBatchUpdate, self).setUp()
+        user = User.query.filter(User.email == self.emails[0]).first()
+        permission = Permission(name='change_stock')
+        db.session.add(permission)
+        db.session.flush()
+        db.session.add(UserPermission(user_id=user.id, permission_id=permission.id))
+        db.session.commit()
+        self.headers = self.login(self.emails[0])
+        self.stocks = [stock.id for stock in Stock.query.join(Product, Product.id == Stock.product_id)
+                       .filter(Product.retail_shop_id.in_(user.retail_shop_ids)).order_by(Stock.id).limit(4)]
+        other_shops = User.query.filter(User.email == self.emails[1]).first().retail_shop_ids
+        self.other = Stock.query.join(Product, Product.id == Stock.product_id) \
+            .filter(Product.retail_shop_id.in_(other_shops)).first().id
+        self.before = self.batch_numbers()
+
+    def put(self, rows, args='__batch'):
+        with self.client:
+            return self.client.put('/api/v1/stock?%s' % args, data=json.dumps(rows), headers=self.headers)
+
+    def batch_numbers(self):
+        db.session.expire_all()
+        return {stock.id: stock.batch_number for stock in Stock.query.filter(Stock.id.in_(self.stocks + [self.other]))}
+
+    def rows(self):
+        # Two good rows around a missing id, another brand's stock and a value the schema rejects.
+        return [{'id': self.stocks[0], 'batch_number': 'NEW0'},
+                {'id': str(uuid4()), 'batch_number': 'NEW1'},
+                {'id': self.other, 'batch_number': 'NEW2'},
+                {'id': self.stocks[1], 'units_purchased': 'many'},
+                {'id': self.stocks[2], 'batch_number': 'NEW4'}]
+
+    def test_partial(self):
+        response = self.put(self.rows())
+        self.assertStatus(response, 201)
+        self.assertEqual(sorted(response.json['errors']), ['1', '2', '3'])
+        self.assertEqual([row['id'] for row in response.json['data']], [self.stocks[0], self.stocks[2]])
+        expected = dict(self.before, **{self.stocks[0]: 'NEW0', self.stocks[2]: 'NEW4'})
+        self.assertEqual(self.batch_numbers(), expected)
+
+    def test_atomic(self):
+        response = self.put(self.rows(), '__batch&__atomic')
+        self.assert400(response)
+        self.assertEqual(sorted(response.json['errors']), ['1', '2', '3'])
+        self.assertEqual(self.batch_numbers(), self.before)
+        # Without the bad rows the same request goes through as a whole.
+        rows = [row for index, row in enumerate(self.rows()) if index in (0, 4)]
+        self.assertStatus(self.put(rows, '__batch&__atomic'), 201)
+        self.assertEqual(self.batch_numbers(), dict(self.before, **{self.stocks[0]: 'NEW0', self.stocks[2]: 'NEW4'}))
+
+    def test_all_failing(self):
+        response = self.put([row for index, row in enumerate(self.rows()) if index in (1, 2, 3)])
+        self.assert400(response)
+        self.assertEqual(self.batch_numbers(), self.before)
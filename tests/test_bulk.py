@@ -0,0 +1,76 @@
+import json
+
+from manager import db
+from src.products.models import Product, Stock
+from src.user.models import User, Permission, UserPermission
+from .base import SeededTestCase
+
+
+class TestBulkInsert(SeededTestCase):
+
+    def setUp(self):
+        super(TestBulkInsert, self).setUp()
+        user = User.query.filter(User.email == self.emails[0]).first()
+        for name in ('create_stock', 'create_product'):
+            permission = Permission(name=name)
+            db.session.add(permission)
+            db.session.flush()
+            db.session.add(UserPermission(user_id=user.id, permission_id=permission.id))
+        db.session.commit()
+        self.headers = self.login(self.emails[0])
+        self.products = [product.id for product in Product.query.filter(Product.retail_shop_id.in_(
+            user.retail_shop_ids)).order_by(Product.id).limit(3)]
+        other_shop = User.query.filter(User.email == self.emails[1]).first().retail_shop_ids[0]
+        self.other = Product.query.filter(Product.retail_shop_id == other_shop).first().id
+
+    def post(self, rows, url='/api/v1/stock?__bulk'):
+        with self.client:
+            return self.client.post(url, data=json.dumps(rows), headers=self.headers)
+
+    def test_insert(self):
+        rows = [{'product_id': product_id, 'units_purchased': 10 + index, 'purchase_amount': 5,
+                 'selling_amount': 6, 'batch_number': 'B%d' % index, 'expiry_date': '2030-01-01'}
+                for index, product_id in enumerate(self.products * 5)]
+        response = self.post(rows)
+        self.assertStatus(response, 201)
+        ids = response.json['data']
+        self.assertEqual(len(set(ids)), len(rows))
+        stocks = {stock.id: stock for stock in Stock.query.filter(Stock.id.in_(ids))}
+        self.assertEqual([(stocks[stock_id].product_id, stocks[stock_id].units_purchased) for stock_id in ids],
+                         [(row['product_id'], row['units_purchased']) for row in rows])
+        self.assertTrue(all(stock.quantity_sold == 0 and not stock.is_sold for stock in stocks.values()))
+
+    def test_nulls(self):
+        # An explicit null is written as such, a missing value takes the column default.
+        base = {'product_id': self.products[0], 'units_purchased': 10, 'purchase_amount': 5, 'selling_amount': 6}
+        rows = [dict(base, default_stock=None, distributor_bill_id=None), dict(base),
+                dict(base, default_stock=True, batch_number='B1')]
+        response = self.post(rows)
+        self.assertStatus(response, 201)
+        stocks = {stock.id: stock for stock in Stock.query.filter(Stock.id.in_(response.json['data']))}
+        self.assertEqual([(stocks[stock_id].default_stock, stocks[stock_id].batch_number)
+                          for stock_id in response.json['data']], [(None, None), (False, None), (True, 'B1')])
+
+    def test_permission(self):
+        # One row of another brand's product refuses the whole batch.
+        count = Stock.query.count()
+        rows = [{'product_id': product_id, 'units_purchased': 10, 'purchase_amount': 5, 'selling_amount': 6}
+                for product_id in self.products + [self.other]]
+        self.assert403(self.post(rows))
+        self.assertEqual(Stock.query.count(), count)
+        self.assertStatus(self.post(rows[:-1]), 201)
+        self.assertEqual(Stock.query.count(), count + len(self.products))
+
+    def test_related(self):
+        # A product with stocks goes through the session after the plain rows, its stocks with it.
+        template = Product.query.get(self.products[0])
+        base = {'min_stock': 5, 'retail_shop_id': template.retail_shop_id, 'brand_id': template.brand_id,
+                'quantity_label': 'TAB', 'barcode': '12345678'}
+        rows = [dict(base, name='plain'), dict(base, name='stocked', stocks=[{'units_purchased': 10,
+                                                                               'purchase_amount': 5,
+                                                                               'selling_amount': 6}])]
+        response = self.post(rows, '/api/v1/product?__bulk')
+        self.assertStatus(response, 201)
+        products = [Product.query.get(product_id) for product_id in response.json['data']]
+        self.assertEqual([product.name for product in products], ['plain', 'stocked'])
+        self.assertEqual([product.stocks.count() for product in products], [0, 1])
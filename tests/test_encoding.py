@@ -0,0 +1,40 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
+from uuid import uuid4
+
+import brotli
+
+from src.utils.api import dumps
+from .base import SeededTestCase
+
+
+class TestResponseEncoding(SeededTestCase):
+
+    def test_dumps(self):
+        data = {'name': 'Crocin 500 – टैबलेट', 'price': Decimal('12.50'), 'ratio': 0.1, 'id': uuid4(),
+                'expiry_date': date(2030, 1, 1), 'created_on': datetime(2017, 3, 4, 5, 6, 7, 89), 'empty': None,
+                'items': [{'b': 1, 'a': [True, False, 'x"y\\z\n']}], 'count': 10 ** 12}
+        self.assertIsNotNone(dumps.__globals__['orjson'])
+        # The test app runs in debug mode, which pretty prints.
+        with mock.patch.dict(self.app.config, JSONIFY_PRETTYPRINT_REGULAR=False):
+            fast = dumps(data)
+            with mock.patch.dict(dumps.__globals__, orjson=None):
+                plain = dumps(data)
+        self.assertIsInstance(plain, bytes)
+        self.assertEqual(fast, plain)
+        self.assertEqual(json.loads(plain.decode('utf-8'))['name'], data['name'])
+
+    def test_content_encoding(self):
+        url = '/api/v1/product?__limit=20'
+        body = self.client.get(url, headers=dict(self.headers, **{'Accept-Encoding': 'identity'})).data
+        self.assertGreater(len(body), self.app.config['COMPRESS_MIN_SIZE'])
+        for accept, encoding, decompress in (('br, gzip', 'br', brotli.decompress),
+                                             ('gzip', 'gzip', gzip.decompress),
+                                             ('identity', None, lambda data: data)):
+            response = self.client.get(url, headers=dict(self.headers, **{'Accept-Encoding': accept}))
+            self.assert200(response)
+            self.assertEqual(response.headers.get('Content-Encoding'), encoding, accept)
+            self.assertEqual(decompress(response.data), body, accept)
@@ -0,0 +1,64 @@
+import json
+
+from manager import db
+from src.products.models import Product, Stock
+from src.user.models import User, Permission, UserPermission
+from .base import SeededTestCase
+
+
+class TestETag(SeededTestCase):
+
+    def setUp(self):
+        super(TestETag, self).setUp()
+        user = User.query.filter(User.email == self.emails[0]).first()
+        permission = Permission(name='change_product')
+        db.session.add(permission)
+        db.session.flush()
+        db.session.add(UserPermission(user_id=user.id, permission_id=permission.id))
+        db.session.commit()
+        self.headers = self.login(self.emails[0])
+        self.product = Product.query.filter(Product.retail_shop_id.in_(user.retail_shop_ids)) \
+            .order_by(Product.id).first()
+
+    def get(self, url, etag=None):
+        headers = dict(self.headers, **{'If-None-Match': etag} if etag else {})
+        with self.client:
+            return self.client.get(url, headers=headers)
+
+    def assertETagChanges(self, url, write):
+        response = self.get(url)
+        self.assert200(response)
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.get(url, etag)
+        self.assertStatus(response, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+
+        write()
+        response = self.get(url, etag)
+        self.assert200(response)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertStatus(self.get(url, response.headers['ETag']), 304)
+
+    def patch(self):
+        with self.client:
+            response = self.client.patch('/api/v1/product/%s' % self.product.id, headers=self.headers,
+                                         data=json.dumps({'name': 'renamed'}))
+        self.assert200(response)
+
+    def sell_stock(self):
+        # Stock levels are read through hybrids, the stock rows count towards the product's validator.
+        stock = Stock.query.filter(Stock.product_id == self.product.id).first()
+        stock.units_purchased += 1
+        db.session.commit()
+
+    def test_item(self):
+        self.assertETagChanges('/api/v1/product/%s' % self.product.id, self.patch)
+
+    def test_list(self):
+        self.assertETagChanges('/api/v1/product', self.patch)
+
+    def test_related(self):
+        self.assertETagChanges('/api/v1/product/%s' % self.product.id, self.sell_stock)
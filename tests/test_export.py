@@ -0,0 +1,54 @@
+import json
+from unittest import mock
+
+from manager import db
+from src.products.models import Product, Stock
+from src.products.resources import StockResource
+from src.user.models import User, Role, UserRole
+from .base import SeededTestCase
+
+
+class TestExportLimit(SeededTestCase):
+
+    def setUp(self):
+        super(TestExportLimit, self).setUp()
+        user = User.query.filter(User.email == self.emails[0]).first()
+        self.ids = {stock.id for stock in Stock.query.join(Product, Product.id == Stock.product_id)
+                    .filter(Product.retail_shop_id.in_(user.retail_shop_ids))}
+        self.user_id = user.id
+
+    def export(self, args=''):
+        # Not inside `with self.client`, the streamed body pushes the request context again.
+        response = self.client.get('/api/v1/stock?__export__=ndjson%s' % args, headers=self.headers)
+        if response.status_code != 200:
+            return response.status_code, None
+        return 200, [json.loads(line)['id'] for line in response.data.decode('utf-8').splitlines()]
+
+    def make_staff(self):
+        UserRole.query.filter(UserRole.user_id == self.user_id).delete()
+        staff = Role(name='staff')
+        db.session.add(staff)
+        db.session.flush()
+        db.session.add(UserRole(user_id=self.user_id, role_id=staff.id))
+        db.session.commit()
+        self.headers = self.login(self.emails[0])
+
+    @mock.patch.object(StockResource, 'max_export_limit', 7)
+    def test_unlimited_role(self):
+        # The seeded user is an admin.
+        self.assertGreater(len(self.ids), 7)
+        status, ids = self.export()
+        self.assertEqual((status, sorted(ids)), (200, sorted(self.ids)))
+
+    @mock.patch.object(StockResource, 'max_export_limit', 7)
+    def test_capped(self):
+        self.make_staff()
+        # Every row exactly once over the pages, none of them longer than the cap.
+        pages = [self.export('&__page=%d' % page) for page in range(1, (len(self.ids) + 6) // 7 + 1)]
+        self.assertEqual({status for status, _ in pages}, {200})
+        self.assertEqual([len(ids) for _, ids in pages[:-1]], [7] * (len(pages) - 1))
+        self.assertEqual(self.export(), pages[0])
+        exported = [stock_id for _, ids in pages for stock_id in ids]
+        self.assertEqual(sorted(exported), sorted(self.ids))
+        self.assertEqual(self.export('&__page=%d' % (len(pages) + 1)), (200, []))
+        self.assertEqual(self.export('&__page=0'), (404, None))
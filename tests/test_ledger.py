@@ -0,0 +1,92 @@
+from sqlalchemy import func
+
+from manager import db
+from src.orders.models import Order, Item
+from src.products.ledger import mark_sold_stock, reconcile_stock
+from src.products.models import Stock
+from .base import SeededTestCase
+
+
+class TestStockLedger(SeededTestCase):
+
+    def setUp(self):
+        super(TestStockLedger, self).setUp()
+        self.template = Order.query.order_by(Order.id).first()
+        self.stock = Stock.query.filter(Stock.quantity_sold < Stock.units_purchased - 10).order_by(Stock.id).first()
+
+    def sell(self, stock, quantity):
+        order = Order(user_id=self.template.user_id, retail_shop_id=self.template.retail_shop_id,
+                      current_status_id=self.template.current_status_id)
+        item = Item(product_id=stock.product_id, stock_id=stock.id, quantity=quantity, unit_price=1)
+        order.items.append(item)
+        db.session.add(order)
+        db.session.commit()
+        return item
+
+    def quantity_sold(self, stock):
+        db.session.refresh(stock)
+        return stock.quantity_sold
+
+    def assertReconciled(self):
+        # The counters match the items, so rebuilding them from scratch changes nothing.
+        sold = dict(db.session.query(Item.stock_id, func.sum(Item.quantity)).group_by(Item.stock_id))
+        for stock in Stock.query:
+            self.assertAlmostEqual(stock.quantity_sold, sold.get(stock.id, 0), places=4, msg=stock.id)
+        self.assertEqual(reconcile_stock(), 0)
+
+    def test_counter(self):
+        other = Stock.query.filter(Stock.id != self.stock.id, Stock.quantity_sold < Stock.units_purchased - 10) \
+            .order_by(Stock.id).first()
+        start, other_start = self.quantity_sold(self.stock), self.quantity_sold(other)
+
+        # Inserted.
+        item = self.sell(self.stock, 3)
+        self.assertEqual(self.quantity_sold(self.stock), start + 3)
+        # Quantity changed.
+        item.quantity = 5
+        db.session.commit()
+        self.assertEqual(self.quantity_sold(self.stock), start + 5)
+        # Moved to another batch, with a new quantity.
+        item.stock_id, item.quantity = other.id, 2
+        db.session.commit()
+        self.assertEqual((self.quantity_sold(self.stock), self.quantity_sold(other)), (start, other_start + 2))
+        self.assertReconciled()
+        # Deleted.
+        db.session.delete(item)
+        db.session.commit()
+        self.assertEqual((self.quantity_sold(self.stock), self.quantity_sold(other)), (start, other_start))
+        self.assertReconciled()
+
+    def test_rollback(self):
+        start = self.quantity_sold(self.stock)
+        item = Item(product_id=self.stock.product_id, stock_id=self.stock.id, quantity=4, unit_price=1,
+                    order_id=self.template.id)
+        db.session.add(item)
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.quantity_sold(self.stock), start)
+
+    def test_sold_out(self):
+        self.sell(self.stock, self.stock.units_purchased - self.stock.quantity_sold)
+        self.assertTrue(self.stock.is_sold)
+        self.assertEqual(mark_sold_stock(), 0)
+
+    def test_closed_by_hand(self):
+        self.stock.is_sold = True
+        db.session.commit()
+        self.sell(self.stock, 1)
+        self.assertTrue(self.stock.is_sold)
+        self.assertEqual(mark_sold_stock(), 0)
+        reconcile_stock()
+        db.session.refresh(self.stock)
+        self.assertTrue(self.stock.is_sold)
+
+    def test_mark_sold_stock(self):
+        # Sold out around the ledger, e.g. seeded rows.
+        table = Stock.__table__
+        db.session.execute(table.update().where(table.c.id == self.stock.id)
+                           .values(quantity_sold=table.c.units_purchased))
+        db.session.commit()
+        self.assertEqual(mark_sold_stock(), 1)
+        db.session.refresh(self.stock)
+        self.assertTrue(self.stock.is_sold)
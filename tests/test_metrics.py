@@ -0,0 +1,29 @@
+from flask_testing import TestCase
+
+from manager import app
+from src import configs
+
+
+class TestMetricsAccess(TestCase):
+
+    def create_app(self):
+        return app
+
+    def setUp(self):
+        app.config.from_object(configs.get('testing'))
+
+    def test_hidden_by_default(self):
+        self.assert404(self.client.get('/metrics'))
+
+    def test_token(self):
+        app.config['METRICS_TOKEN'] = 'secret'
+        self.assert401(self.client.get('/metrics'))
+        self.assert401(self.client.get('/metrics', headers={'Authorization': 'Bearer other'}))
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assert200(response)
+        self.assertIn(b'# TYPE', response.data)
+
+    def test_allowed_ips(self):
+        app.config['METRICS_ALLOWED_IPS'] = ('10.0.0.5',)
+        self.assert404(self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.6'}))
+        self.assert200(self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}))
@@ -0,0 +1,142 @@
+from base64 import urlsafe_b64encode
+from datetime import date, datetime
+
+from manager import db
+from src.products.models import Product, Stock
+from src.user.models import User
+from src.utils.exceptions import CustomException
+from src.utils.pagination import encode_cursor, decode_cursor, keyset_filter, count_rows, estimate_count
+from .base import SeededTestCase
+
+
+class TestKeysetPagination(SeededTestCase):
+
+    def setUp(self):
+        super(TestKeysetPagination, self).setUp()
+        # Ties on the sort keys, and NULLs sorting last ascending and first descending.
+        stocks = Stock.query.order_by(Stock.id).all()
+        for index, stock in enumerate(stocks):
+            if index % 3 == 0:
+                stock.expiry_date = None
+            elif index % 3 == 1:
+                stock.expiry_date = date(2030, 1, 1)
+        db.session.commit()
+        self.shop_ids = [str(shop_id) for shop_id in User.query.filter(User.email == self.emails[0]).first()
+                         .retail_shop_ids]
+
+    def walk(self, query, columns, page_size=7):
+        # Ids page by page, every cursor going through encode_cursor/decode_cursor as clients send it back.
+        keys = [[column.key, desc] for column, desc in columns]
+        query = query.order_by(*[column.desc() if desc else column for column, desc in columns])
+        ids, cursor = [], None
+        while True:
+            page = query
+            if cursor is not None:
+                page = page.filter(keyset_filter(columns, decode_cursor(cursor, keys)))
+            items = page.limit(page_size).all()
+            ids.extend(item.id for item in items)
+            if len(items) < page_size:
+                return ids, [item.id for item in query]
+            cursor = encode_cursor(keys, [getattr(items[-1], column.key) for column, desc in columns])
+
+    def assertWalks(self, query, columns):
+        ids, expected = self.walk(query, columns)
+        self.assertEqual(len(expected), len(set(expected)))
+        self.assertEqual(ids, expected)
+
+    def test_single_key(self):
+        self.assertWalks(Product.query, [(Product.id, False)])
+        self.assertWalks(Product.query, [(Product.id, True)])
+
+    def test_ties(self):
+        # 80 products share 20 values of min_stock.
+        self.assertWalks(Product.query, [(Product.min_stock, False), (Product.id, False)])
+        self.assertWalks(Product.query, [(Product.min_stock, True), (Product.id, True)])
+
+    def test_mixed_directions(self):
+        self.assertWalks(Product.query, [(Product.min_stock, False), (Product.id, True)])
+        self.assertWalks(Product.query, [(Product.min_stock, True), (Product.name, False), (Product.id, True)])
+        self.assertWalks(Stock.query, [(Stock.units_purchased, True), (Stock.created_on, False), (Stock.id, False)])
+
+    def test_nulls(self):
+        for expiry_desc in (False, True):
+            for id_desc in (False, True):
+                self.assertWalks(Stock.query, [(Stock.expiry_date, expiry_desc), (Stock.id, id_desc)])
+        self.assertWalks(Stock.query, [(Stock.expiry_date, True), (Stock.units_purchased, False), (Stock.id, True)])
+
+    def test_cursor_values(self):
+        keys = [['created_on', False], ['expiry_date', True], ['batch_number', False], ['id', False]]
+        values = [datetime(2017, 3, 4, 5, 6, 7, 89), date(2030, 1, 1), None, 'a3c1']
+        self.assertEqual(decode_cursor(encode_cursor(keys, values), keys), values)
+
+    def test_api(self):
+        expected = [stock.id for stock in Stock.query.filter(Stock.retail_shop_id.in_(self.shop_ids))
+                    .order_by(Stock.expiry_date.desc(), Stock.id.desc())]
+        ids, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get('/api/v1/stock?__order_by=-expiry_date&__limit=7&__cursor=%s' % cursor,
+                                       headers=self.headers)
+            self.assert200(response)
+            ids.extend(row['id'] for row in response.json['data'])
+            cursor = response.json['next_cursor']
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.assertRaises(CustomException, decode_cursor, 'not a cursor', [['id', False]])
+        keys = [['expiry_date', True], ['id', True]]
+        valid = encode_cursor(keys, [None, Stock.query.first().id])
+        # Another ordering, a value short, a value of the wrong type, and bytes that are not json.
+        cursors = ['not a cursor', '%%%', valid[:-4], urlsafe_b64encode(b'\xff\xfe').decode('ascii'),
+                   encode_cursor([['units_sold', False], ['id', False]], [1, 'a3c1']),
+                   encode_cursor(keys, [None]), encode_cursor(keys, [None, 'a3c1']),
+                   urlsafe_b64encode(b'{"k": [["expiry_date", true], ["id", true]], "v": [{"d": "soon"}, 1]}')
+                   .decode('ascii')]
+        for cursor in cursors:
+            response = self.client.get('/api/v1/stock?__order_by=-expiry_date&__cursor=%s' % cursor,
+                                       headers=self.headers)
+            self.assert400(response, cursor)
+            self.assertTrue(response.json['error'])
+        self.assert200(self.client.get('/api/v1/stock?__order_by=-expiry_date&__cursor=%s' % valid,
+                                       headers=self.headers))
+
+
+class TestTotals(SeededTestCase):
+
+    def setUp(self):
+        super(TestTotals, self).setUp()
+        db.session.execute('ANALYZE')
+        db.session.commit()
+        shop_ids = User.query.filter(User.email == self.emails[0]).first().retail_shop_ids
+        self.stocks = Stock.query.join(Product, Product.id == Stock.product_id) \
+            .filter(Product.retail_shop_id.in_(shop_ids)).count()
+        self.products = Product.query.filter(Product.retail_shop_id.in_(shop_ids)).count()
+
+    def total(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assert200(response)
+        return len(response.json['data']), response.json['total']
+
+    def test_modes(self):
+        self.assertEqual(self.total('/api/v1/stock?__limit=5&__total=exact'), (5, self.stocks))
+        self.assertEqual(self.total('/api/v1/stock?__limit=5&__total=none'), (5, None))
+        # An unknown mode is the resource's default.
+        self.assertEqual(self.total('/api/v1/stock?__limit=5&__total=whatever'), (5, self.stocks))
+        # Whatever the planner expects the permission filter to leave.
+        rows, estimate = self.total('/api/v1/stock?__limit=5&__total=estimate')
+        self.assertEqual(rows, 5)
+        self.assertIsInstance(estimate, int)
+        self.assertGreaterEqual(estimate, 0)
+        self.assertEqual(self.total('/api/v1/stock?__limit=5&__total=estimate&__page=2'), (5, estimate))
+
+    def test_short_first_page(self):
+        # A first page that is not full is the whole result, its length is the total in every mode but none.
+        self.assertLess(self.products, 100)
+        for mode, total in (('exact', self.products), ('estimate', self.products), ('none', None)):
+            self.assertEqual(self.total('/api/v1/product?__limit=100&__total=%s' % mode), (self.products, total))
+
+    def test_estimate_count(self):
+        # Straight from the statistics for a whole table, after ANALYZE.
+        self.assertEqual(estimate_count(Stock.query), Stock.query.count())
+        self.assertEqual(count_rows(Stock.query.order_by(Stock.id), 'estimate'), Stock.query.count())
+        self.assertEqual(count_rows(Stock.query.filter(Stock.units_purchased > 0), 'exact'), Stock.query.count())
+        self.assertIsNone(count_rows(Stock.query, 'none'))
@@ -0,0 +1,51 @@
+from manager import app
+from src.products.models import Product
+from src.user.models import User
+from src.utils.instrumentation import QueryBudgetExceeded
+from .base import SeededTestCase
+
+
+class TestQueryBudgets(SeededTestCase):
+    # TestConfig is strict, a GET running more queries than QUERY_BUDGETS allows its endpoint raises.
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assert200(response)
+        self.assertIn('X-Query-Count', response.headers)
+        return response
+
+    def shop_id(self):
+        return str(User.query.filter(User.email == self.emails[0]).first().retail_shop_ids[0])
+
+    def test_product_list(self):
+        response = self.get('/api/v1/product?__limit=50')
+        self.assertEqual(len(response.json['data']), 40)
+
+    def test_stock_list(self):
+        self.get('/api/v1/stock?__limit=50')
+
+    def test_order_list(self):
+        response = self.get('/api/v1/order?__limit=20')
+        self.assertEqual(len(response.json['data']), 20)
+
+    def test_product_search(self):
+        self.get('/api/v1/product/search?retail_shop_id=%s&q=a' % self.shop_id())
+
+    def test_product_barcode(self):
+        shop_id = self.shop_id()
+        barcode = Product.query.filter(Product.retail_shop_id == shop_id).first().barcode
+        self.assertEqual(self.get('/api/v1/product/barcode/%s?retail_shop_id=%s' % (barcode, shop_id))
+                         .json['data']['barcode'], barcode)
+
+    def test_catalog_sync(self):
+        self.get('/api/v1/sync/catalog?retail_shop_id=%s' % self.shop_id())
+
+    def test_over_budget(self):
+        app.config['QUERY_BUDGETS'] = dict(app.config['QUERY_BUDGETS'], product_view=1)
+        # The client pops the request context the failed request leaves behind.
+        with self.client, self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/v1/product?__limit=50', headers=self.headers)
+
+    def test_over_budget_not_strict(self):
+        app.config.update(QUERY_BUDGETS=dict(app.config['QUERY_BUDGETS'], product_view=1), QUERY_BUDGET_STRICT=False)
+        self.get('/api/v1/product?__limit=50')
@@ -0,0 +1,74 @@
+import json
+from uuid import uuid4
+
+from manager import db
+from src.products.models import Product, ProductTag, Tag
+from src.user.models import User, Permission, UserPermission
+from .base import SeededTestCase
+
+
+class TestBulkRelations(SeededTestCase):
+
+    def setUp(self):
+        super(TestBulkRelations, self).setUp()
+        user = User.query.filter(User.email == self.emails[0]).first()
+        for name in ('create_product_tag', 'change_product_tag', 'remove_product_tag'):
+            permission = Permission(name=name)
+            db.session.add(permission)
+            db.session.flush()
+            db.session.add(UserPermission(user_id=user.id, permission_id=permission.id))
+        db.session.commit()
+        self.headers = self.login(self.emails[0])
+        shop_id = user.retail_shop_ids[0]
+        self.product = Product.query.filter(Product.retail_shop_id == shop_id).order_by(Product.id).first()
+        self.tagged = [row.tag_id for row in ProductTag.query.filter(ProductTag.product_id == self.product.id)]
+        self.untagged = [tag.id for tag in Tag.query.filter(Tag.retail_shop_id == shop_id,
+                                                            ~Tag.id.in_(self.tagged)).order_by(Tag.id)]
+        other_shop = User.query.filter(User.email == self.emails[1]).first().retail_shop_ids[0]
+        self.other = ProductTag.query.join(Product, Product.id == ProductTag.product_id) \
+            .filter(Product.retail_shop_id == other_shop).first()
+
+    def post(self, rows):
+        with self.client:
+            return self.client.post('/api/v1/product_tag', data=json.dumps(rows), headers=self.headers)
+
+    def tags(self):
+        db.session.expire_all()
+        return sorted(row.tag_id for row in ProductTag.query.filter(ProductTag.product_id == self.product.id))
+
+    def test_add_and_remove(self):
+        add = [{'__action': 'add', 'product_id': self.product.id, 'tag_id': tag_id}
+               for tag_id in self.untagged[:2] + self.untagged[:1] + self.tagged[:1]]
+        # The repeated pair and the one already there are skipped by ON CONFLICT DO NOTHING.
+        self.assert200(self.post(add))
+        self.assertEqual(self.tags(), sorted(self.tagged + self.untagged[:2]))
+
+        remove = [{'__action': 'remove', 'product_id': self.product.id, 'tag_id': tag_id}
+                  for tag_id in self.tagged + self.untagged[2:3]]
+        self.assert200(self.post(remove))
+        self.assertEqual(self.tags(), sorted(self.untagged[:2]))
+
+    def test_update(self):
+        row = ProductTag.query.filter(ProductTag.product_id == self.product.id, ProductTag.tag_id == self.tagged[0]) \
+            .first()
+        rows = [{'__action': 'update', 'id': row.id, 'product_id': self.product.id, 'tag_id': self.untagged[0]},
+                {'__action': 'add', 'product_id': self.product.id, 'tag_id': self.untagged[1]}]
+        self.assert200(self.post(rows))
+        self.assertEqual(self.tags(), sorted(self.tagged[1:] + self.untagged[:2]))
+        self.assert404(self.post([{'__action': 'update', 'id': str(uuid4()), 'product_id': self.product.id,
+                                   'tag_id': self.untagged[2]}]))
+
+    def test_nothing_applied_on_error(self):
+        row = ProductTag.query.filter(ProductTag.product_id == self.product.id, ProductTag.tag_id == self.tagged[0]) \
+            .first()
+        add = {'__action': 'add', 'product_id': self.product.id, 'tag_id': self.untagged[0]}
+        # Onto a pair that already exists, of another shop's product, and to another shop's product.
+        for update in ({'__action': 'update', 'id': row.id, 'product_id': self.product.id, 'tag_id': self.tagged[1]},
+                       {'__action': 'update', 'id': self.other.id, 'product_id': self.other.product_id,
+                        'tag_id': self.other.tag_id},
+                       {'__action': 'update', 'id': row.id, 'product_id': self.other.product_id,
+                        'tag_id': self.tagged[0]}):
+            response = self.post([add, update])
+            self.assertIn(response.status_code, (400, 401), update)
+            self.assertTrue(response.json['error'])
+            self.assertEqual(self.tags(), sorted(self.tagged))
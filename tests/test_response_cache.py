@@ -0,0 +1,56 @@
+import json
+import os
+import unittest
+
+from flask import Flask
+
+from manager import db
+from src import configs
+from src.products.models import Product, Stock
+from src.user.models import User, Permission, UserPermission
+from src.utils.cache import ResponseCache
+from .base import SeededTestCase
+
+
+class TestResponseCache(SeededTestCase):
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        user = User.query.filter(User.email == self.emails[0]).first()
+        permission = Permission(name='change_stock')
+        db.session.add(permission)
+        db.session.flush()
+        db.session.add(UserPermission(user_id=user.id, permission_id=permission.id))
+        db.session.commit()
+        self.headers = self.login(self.emails[0])
+        self.stock = Stock.query.join(Product, Product.id == Stock.product_id) \
+            .filter(Product.retail_shop_id.in_(user.retail_shop_ids)).order_by(Stock.id).first()
+        self.url = '/api/v1/stock/%s' % self.stock.id
+
+    def batch_number(self):
+        with self.client:
+            response = self.client.get(self.url, headers=self.headers)
+        self.assert200(response)
+        return response.json['batch_number']
+
+    def test_put_invalidates(self):
+        before = self.batch_number()
+        # Written around the session nothing is invalidated, the cached page is served.
+        table = Stock.__table__
+        db.session.execute(table.update().where(table.c.id == self.stock.id).values(batch_number='AROUND'))
+        db.session.commit()
+        self.assertEqual(self.batch_number(), before)
+
+        with self.client:
+            response = self.client.put('/api/v1/stock?__batch', headers=self.headers,
+                                       data=json.dumps([{'id': self.stock.id, 'batch_number': 'PUT'}]))
+        self.assertStatus(response, 201)
+        self.assertEqual(self.batch_number(), 'PUT')
+
+    @unittest.skipIf(os.environ.get('REDIS_URL'), 'REDIS_URL is set')
+    def test_prod_without_redis(self):
+        app = Flask(__name__)
+        app.config.from_object(configs.get('prod'))
+        cache = ResponseCache()
+        cache.init_app(app)
+        self.assertFalse(cache.enabled)
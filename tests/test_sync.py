@@ -0,0 +1,67 @@
+from datetime import datetime
+from unittest import mock
+
+from manager import db
+from src.products.models import Product, ProductTax
+from src.user.models import User
+from src.utils.pagination import DATETIME_FORMAT
+from .base import SeededTestCase
+
+
+class TestCatalogSync(SeededTestCase):
+
+    def setUp(self):
+        super(TestCatalogSync, self).setUp()
+        self.shop_id = User.query.filter(User.email == self.emails[0]).first().retail_shop_ids[0]
+        # Rows written by the test are settled as soon as they are committed.
+        patch = mock.patch.dict(self.app.config, SYNC_SETTLE_SECONDS=0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def sync(self, watermark=None, limit=7):
+        # Follows the watermarks of one round, returns its pages and the watermark of the next round.
+        pages = []
+        while True:
+            url = '/api/v1/sync/catalog?retail_shop_id=%s&__limit=%d' % (self.shop_id, limit)
+            with self.client:
+                response = self.client.get(url + ('&since=%s' % watermark if watermark else ''), headers=self.headers)
+            self.assert200(response)
+            pages.append(response.json)
+            watermark = response.json['watermark']
+            if not response.json['more']:
+                return pages, watermark
+
+    def rows(self, pages, table):
+        return [row for page in pages for row in page['data'].get(table, [])]
+
+    def test_resume(self):
+        pages, _ = self.sync()
+        self.assertGreater(len(pages), 2)
+        self.assertTrue(all(sum(len(rows) for rows in page['data'].values()) <= 7 for page in pages))
+        # Each page goes on after the last row of the one before, every row arrives once.
+        products = self.rows(pages, 'product')
+        expected = {product.id: product for product in Product.query.filter(Product.retail_shop_id == self.shop_id)}
+        self.assertEqual(sorted(row['id'] for row in products), sorted(expected))
+        for row in products:
+            self.assertEqual(datetime.strptime(row['updated_on'], DATETIME_FORMAT), expected[row['id']].updated_on)
+
+        self.assertEqual(self.sync(pages[-1]['watermark'])[0][-1]['data'], {})
+
+    def test_tombstones(self):
+        _, watermark = self.sync()
+        pages, watermark = self.sync(watermark)
+        self.assertEqual((pages[-1]['data'], pages[-1]['deleted']), ({}, {}))
+
+        product_tax = ProductTax.query.join(Product, Product.id == ProductTax.product_id) \
+            .filter(Product.retail_shop_id == self.shop_id).first()
+        product = Product.query.get(product_tax.product_id)
+        db.session.delete(product_tax)
+        product.name = 'renamed'
+        db.session.commit()
+
+        # One row a page, the tombstone comes after the rows of the tables that still hold rows.
+        pages, watermark = self.sync(watermark, limit=1)
+        self.assertEqual([row['name'] for row in self.rows(pages, 'product')], ['renamed'])
+        self.assertEqual([page['deleted'] for page in pages if page['deleted']],
+                         [{'product_tax': [product_tax.id]}])
+        self.assertEqual(self.sync(watermark)[0][-1]['deleted'], {})
@@ -0,0 +1,44 @@
+from unittest import mock
+
+from flask import Flask
+from flask_security.utils import encrypt_password
+
+from manager import db
+from src.user.models import User
+from src.user.tokens import StatelessTokens, load_token
+from src.utils.cache import redis
+from .base import SeededTestCase
+
+
+class TestTokenRevocation(SeededTestCase):
+
+    def change_password(self):
+        user = User.query.filter(User.email == self.emails[0]).first()
+        user.password = encrypt_password('changed')
+        db.session.commit()
+
+    def assertRevoked(self):
+        self.assert200(self.client.get('/api/v1/product', headers=self.headers))
+        self.change_password()
+        with self.client:
+            response = self.client.get('/api/v1/product', headers=self.headers)
+        self.assertIn(response.status_code, (401, 403))
+        self.assert200(self.client.get('/api/v1/product', headers=self.login(self.emails[0], 'changed')))
+
+    def test_password_change(self):
+        self.assertRevoked()
+
+    def test_stateless_password_change(self):
+        with mock.patch.dict(self.app.config, STATELESS_AUTH_TOKENS=True), \
+                mock.patch.object(self.app.login_manager, 'token_callback', load_token):
+            self.headers = self.login(self.emails[0])
+            self.assertRevoked()
+
+    def test_needs_shared_cache(self):
+        for backend, enabled in (('local', False), (None, False), ('redis', redis is not None)):
+            app = Flask(__name__)
+            app.login_manager = mock.Mock(token_callback=None)
+            app.config.update(STATELESS_AUTH_TOKENS=True, RESPONSE_CACHE_BACKEND=backend)
+            StatelessTokens().init_app(app)
+            self.assertEqual(app.config['STATELESS_AUTH_TOKENS'], enabled, backend)
+            self.assertEqual(app.login_manager.token_callback is load_token, enabled, backend)